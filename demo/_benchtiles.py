@@ -0,0 +1,978 @@
+#!/usr/bin/env python3
+#
+# _benchtiles - Benchmark _synctiles against a local S3 stand-in
+#
+# Copyright (c) 2026 Benjamin Gilbert
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms of version 2.1 of the GNU Lesser General Public License
+# as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+from __future__ import annotations
+
+from argparse import ArgumentParser
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from hashlib import file_digest, md5
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import multiprocessing
+import os
+from pathlib import Path, PurePath
+import random
+import resource
+from tempfile import TemporaryDirectory
+from threading import Lock
+import time
+from typing import Any
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+from xml.etree import ElementTree as ET
+
+import _synctiles as st
+import numpy as np
+from numpy.typing import NDArray
+import openslide
+from openslide import OpenSlide
+import requests
+import tifffile
+
+REGION = 'us-east-1'
+BUCKET = 'openslide-bench'
+DOWNLOAD_BUCKET = 'openslide-bench-testdata'
+STATS_PATH = '/_stats'
+S3_XMLNS = 'http://s3.amazonaws.com/doc/2006-03-01/'
+SLIDE_TILE_SIZE = 256
+
+
+class S3StandIn(ThreadingHTTPServer):
+    """An in-memory stand-in for the subset of the S3 API used by
+    _synctiles.  Every bucket exists, and request signatures are ignored."""
+
+    daemon_threads = True
+
+    def __init__(self, port: int, latency: float = 0) -> None:
+        super().__init__(('127.0.0.1', port), S3StandInHandler)
+        self.latency = latency
+        self.objects: dict[tuple[str, str], tuple[bytes, str]] = {}
+        # upload ID -> content type and parts
+        self.uploads: dict[str, tuple[str, dict[int, bytes]]] = {}
+        self.stats: dict[str, int] = {}
+        self.lock = Lock()
+
+    def count(self, stat: str, amount: int = 1) -> None:
+        with self.lock:
+            self.stats[stat] = self.stats.get(stat, 0) + amount
+
+
+class S3StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: S3StandIn
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _parse(self) -> tuple[str, str, dict[str, str]]:
+        parts = urlsplit(self.path)
+        bucket, _, key = unquote(parts.path).lstrip('/').partition('/')
+        query = {
+            k: v[0]
+            for k, v in parse_qs(parts.query, keep_blank_values=True).items()
+        }
+        return bucket, key, query
+
+    def _reply(
+        self,
+        status: int,
+        body: bytes = b'',
+        headers: dict[str, str] | None = None,
+    ) -> None:
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _reply_xml(self, status: int, root: ET.Element) -> None:
+        self._reply(
+            status,
+            ET.tostring(root, xml_declaration=True, encoding='utf-8'),
+            {'Content-Type': 'application/xml'},
+        )
+
+    def _error(self, status: int, code: str) -> None:
+        root = ET.Element('Error')
+        ET.SubElement(root, 'Code').text = code
+        ET.SubElement(root, 'Message').text = code
+        self._reply_xml(status, root)
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def do_HEAD(self) -> None:
+        bucket, key, _ = self._parse()
+        if not key:
+            self._reply(200, headers={'x-amz-bucket-region': REGION})
+            return
+        try:
+            data, content_type = self.server.objects[bucket, key]
+        except KeyError:
+            self._error(404, 'NoSuchKey')
+            return
+        self._reply(
+            200,
+            data,
+            {'Accept-Ranges': 'bytes', 'Content-Type': content_type},
+        )
+
+    def do_GET(self) -> None:
+        if self.path == STATS_PATH:
+            with self.server.lock:
+                body = json.dumps(self.server.stats).encode()
+            self._reply(200, body, {'Content-Type': 'application/json'})
+            return
+        bucket, key, query = self._parse()
+        if key:
+            self.server.count('get')
+            try:
+                data, content_type = self.server.objects[bucket, key]
+            except KeyError:
+                self._error(404, 'NoSuchKey')
+                return
+            range_ = self.headers.get('Range', '')
+            if range_.startswith('bytes='):
+                first, _, last = range_.removeprefix('bytes=').partition('-')
+                start = int(first)
+                end = min(int(last) + 1, len(data)) if last else len(data)
+                self._reply(
+                    206,
+                    data[start:end],
+                    {
+                        'Content-Range': (
+                            f'bytes {start}-{end - 1}/{len(data)}'
+                        ),
+                        'Content-Type': content_type,
+                    },
+                )
+                return
+            self._reply(
+                200,
+                data,
+                {
+                    'Content-Type': content_type,
+                    'ETag': f'"{md5(data).hexdigest()}"',
+                },
+            )
+        else:
+            self._list(bucket, query)
+
+    def _list(self, bucket: str, query: dict[str, str]) -> None:
+        self.server.count('list')
+        v2 = query.get('list-type') == '2'
+        prefix = query.get('prefix', '')
+        start = query.get('continuation-token' if v2 else 'marker', '')
+        start = start or query.get('start-after', '')
+        max_keys = int(query.get('max-keys', 1000))
+        urlencode = query.get('encoding-type') == 'url'
+        with self.server.lock:
+            keys = sorted(
+                (k, data)
+                for (b, k), (data, _) in self.server.objects.items()
+                if b == bucket and k.startswith(prefix) and k > start
+            )
+        root = ET.Element('ListBucketResult', xmlns=S3_XMLNS)
+        ET.SubElement(root, 'Name').text = bucket
+        ET.SubElement(root, 'Prefix').text = prefix
+        ET.SubElement(root, 'MaxKeys').text = str(max_keys)
+        truncated = len(keys) > max_keys
+        keys = keys[:max_keys]
+        ET.SubElement(root, 'IsTruncated').text = str(truncated).lower()
+        if v2:
+            ET.SubElement(root, 'KeyCount').text = str(len(keys))
+        if truncated:
+            ET.SubElement(
+                root, 'NextContinuationToken' if v2 else 'NextMarker'
+            ).text = keys[-1][0]
+        if urlencode:
+            ET.SubElement(root, 'EncodingType').text = 'url'
+        for key, data in keys:
+            contents = ET.SubElement(root, 'Contents')
+            ET.SubElement(contents, 'Key').text = (
+                quote(key) if urlencode else key
+            )
+            ET.SubElement(
+                contents, 'LastModified'
+            ).text = '2026-01-01T00:00:00.000Z'
+            ET.SubElement(contents, 'ETag').text = f'"{md5(data).hexdigest()}"'
+            ET.SubElement(contents, 'Size').text = str(len(data))
+            ET.SubElement(contents, 'StorageClass').text = 'STANDARD'
+        self._reply_xml(200, root)
+
+    def do_PUT(self) -> None:
+        bucket, key, query = self._parse()
+        body = self._read_body()
+        if not key:
+            # bucket configuration
+            self._reply(200)
+            return
+        self.server.count('put')
+        self.server.count('put_bytes', len(body))
+        if 'uploadId' in query:
+            with self.server.lock:
+                upload = self.server.uploads.get(query['uploadId'])
+                if upload is not None:
+                    upload[1][int(query['partNumber'])] = body
+            if upload is None:
+                self._error(404, 'NoSuchUpload')
+            else:
+                self._reply(
+                    200, headers={'ETag': f'"{md5(body).hexdigest()}"'}
+                )
+            return
+        content_type = self.headers.get(
+            'Content-Type', 'application/octet-stream'
+        )
+        with self.server.lock:
+            self.server.objects[bucket, key] = (body, content_type)
+        self._reply(200, headers={'ETag': f'"{md5(body).hexdigest()}"'})
+
+    def do_DELETE(self) -> None:
+        bucket, key, query = self._parse()
+        self.server.count('delete')
+        with self.server.lock:
+            if 'uploadId' in query:
+                self.server.uploads.pop(query['uploadId'], None)
+            else:
+                self.server.objects.pop((bucket, key), None)
+        self._reply(204)
+
+    def do_POST(self) -> None:
+        bucket, key, query = self._parse()
+        body = self._read_body()
+        if 'uploads' in query:
+            self._initiate_upload(bucket, key)
+            return
+        if 'uploadId' in query:
+            self._complete_upload(bucket, key, query['uploadId'], body)
+            return
+        if 'delete' not in query:
+            self._error(400, 'NotImplemented')
+            return
+        request = ET.fromstring(body)
+        root = ET.Element('DeleteResult', xmlns=S3_XMLNS)
+        for element in request.iter(f'{{{S3_XMLNS}}}Key'):
+            self.server.count('delete')
+            with self.server.lock:
+                self.server.objects.pop((bucket, element.text or ''), None)
+        self._reply_xml(200, root)
+
+    def _initiate_upload(self, bucket: str, key: str) -> None:
+        upload_id = os.urandom(8).hex()
+        content_type = self.headers.get(
+            'Content-Type', 'application/octet-stream'
+        )
+        with self.server.lock:
+            self.server.uploads[upload_id] = (content_type, {})
+        root = ET.Element('InitiateMultipartUploadResult', xmlns=S3_XMLNS)
+        ET.SubElement(root, 'Bucket').text = bucket
+        ET.SubElement(root, 'Key').text = key
+        ET.SubElement(root, 'UploadId').text = upload_id
+        self._reply_xml(200, root)
+
+    def _complete_upload(
+        self, bucket: str, key: str, upload_id: str, body: bytes
+    ) -> None:
+        numbers = [
+            int(element.text or '')
+            for element in ET.fromstring(body).iter(
+                f'{{{S3_XMLNS}}}PartNumber'
+            )
+        ]
+        with self.server.lock:
+            try:
+                content_type, parts = self.server.uploads.pop(upload_id)
+            except KeyError:
+                self._error(404, 'NoSuchUpload')
+                return
+            data = b''.join(parts[number] for number in numbers)
+            self.server.objects[bucket, key] = (data, content_type)
+        root = ET.Element('CompleteMultipartUploadResult', xmlns=S3_XMLNS)
+        ET.SubElement(root, 'Bucket').text = bucket
+        ET.SubElement(root, 'Key').text = key
+        ET.SubElement(root, 'ETag').text = f'"{md5(data).hexdigest()}"'
+        self._reply_xml(200, root)
+
+
+def serve(port: int, latency: float) -> None:
+    S3StandIn(port, latency).serve_forever()
+
+
+@contextmanager
+def stand_in(port: int, latency: float) -> Iterator[None]:
+    """Run an S3 stand-in in a child process and point boto3 at it."""
+    proc = multiprocessing.Process(
+        target=serve, args=(port, latency), daemon=True
+    )
+    proc.start()
+    os.environ.update(
+        {
+            'AWS_ENDPOINT_URL': f'http://127.0.0.1:{port}',
+            'AWS_ACCESS_KEY_ID': 'bench',
+            'AWS_SECRET_ACCESS_KEY': 'bench',
+            'AWS_DEFAULT_REGION': REGION,
+        }
+    )
+    # wait for the server to start
+    for _ in range(100):
+        try:
+            requests.get(os.environ['AWS_ENDPOINT_URL'] + STATS_PATH)
+            break
+        except requests.ConnectionError:
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        proc.kill()
+        proc.join()
+
+
+def get_stats() -> dict[str, int]:
+    r = requests.get(os.environ['AWS_ENDPOINT_URL'] + STATS_PATH)
+    r.raise_for_status()
+    stats: dict[str, int] = r.json()
+    return stats
+
+
+def bench_upload(count: int, size: int, connections: int) -> None:
+    """Compare tile upload throughput of the thread and asyncio uploaders."""
+    payloads = [random.randbytes(size) for _ in range(16)]
+    storage = st.S3Storage(BUCKET, connections)
+    for name, uploader in (
+        ('thread', st.ThreadUploader(storage, connections)),
+        ('async', st.AsyncUploader(storage, connections)),
+    ):
+        tiles = [
+            st.EncodedTile(
+                PurePath(f'{name}/{i}.jpeg'),
+                md5(payloads[i % len(payloads)]).hexdigest(),
+                payloads[i % len(payloads)],
+                'image/jpeg',
+            )
+            for i in range(count)
+        ]
+        start = time.monotonic()
+        futures = [uploader.submit(tile) for tile in tiles]
+        wait(futures)
+        for future in futures:
+            future.result()
+        elapsed = time.monotonic() - start
+        uploader.shutdown()
+        print(
+            f'{name:>8} uploader: {count} PUTs in {elapsed:.2f} s, '
+            f'{count / elapsed:.0f} PUTs/s'
+        )
+
+
+def write_slide(path: Path, width: int, height: int, tissue: float) -> None:
+    """Write a synthetic pyramidal TIFF with about the specified fraction
+    of tiles containing tissue.  Level 0 is generated one tile at a time,
+    and each lower level is downsampled from the one above it, so every
+    level shows the same image."""
+    cols = -(width // -SLIDE_TILE_SIZE)
+    rows = -(height // -SLIDE_TILE_SIZE)
+    reduced_tile = SLIDE_TILE_SIZE // 4
+    reduced = np.empty((rows * reduced_tile, cols * reduced_tile, 3), np.uint8)
+
+    def reduce(image: NDArray[np.uint8]) -> NDArray[np.uint8]:
+        """Downsample an image by 4 with a box filter."""
+        h, w, _ = image.shape
+        pad_h = -h % 4
+        pad_w = -w % 4
+        if pad_h or pad_w:
+            image = np.pad(
+                image, ((0, pad_h), (0, pad_w), (0, 0)), mode='edge'
+            )
+        blocks = image.reshape(
+            image.shape[0] // 4, 4, image.shape[1] // 4, 4, 3
+        )
+        small: NDArray[np.uint8] = blocks.mean(axis=(1, 3)).astype(np.uint8)
+        return small
+
+    def level0_tiles() -> Iterator[NDArray[np.uint8]]:
+        for row in range(rows):
+            for col in range(cols):
+                rng = np.random.default_rng((col, row))
+                tile = np.full(
+                    (SLIDE_TILE_SIZE, SLIDE_TILE_SIZE, 3), 255, np.uint8
+                )
+                if rng.random() < tissue:
+                    tile[:] = rng.integers(120, 220, 3, np.uint8)
+                    tile[::4, ::4] -= rng.integers(
+                        0, 60, tile[::4, ::4].shape, np.uint8
+                    )
+                reduced[
+                    row * reduced_tile : (row + 1) * reduced_tile,
+                    col * reduced_tile : (col + 1) * reduced_tile,
+                ] = reduce(tile)
+                yield tile
+
+    with tifffile.TiffWriter(path, bigtiff=True) as tiff:
+        tiff.write(
+            level0_tiles(),
+            shape=(height, width, 3),
+            dtype=np.uint8,
+            photometric='rgb',
+            tile=(SLIDE_TILE_SIZE, SLIDE_TILE_SIZE),
+            compression='zlib',
+            subfiletype=0,
+        )
+        image = reduced[: -(height // -4), : -(width // -4)]
+        while max(width, height) > 4 * SLIDE_TILE_SIZE:
+            height, width, _ = image.shape
+            tiff.write(
+                image,
+                photometric='rgb',
+                tile=(SLIDE_TILE_SIZE, SLIDE_TILE_SIZE),
+                compression='zlib',
+                subfiletype=1,
+            )
+            image = reduce(image)
+
+
+def _tile_slide(path: Path, options: st.TileOptions) -> tuple[int, float, int]:
+    """Tile a slide in a fresh process.  Return the tile count, the
+    elapsed time, and the peak RSS in KiB."""
+    storage = st.S3Storage(BUCKET, options.upload_workers)
+    pool = st.TilePool(storage, options)
+    pool.open(OpenSlide(path), path)
+    try:
+        start = time.monotonic()
+        st.sync_image(
+            pool, PurePath(path.name), None, PurePath('memory'), {}, {}
+        )
+        elapsed = time.monotonic() - start
+    finally:
+        pool.shutdown()
+    count = pool.generator(None).dz.tile_count
+    return count, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def bench_memory(sizes: list[int], options: st.TileOptions) -> None:
+    """Report peak memory use while tiling slides of increasing size."""
+    context = multiprocessing.get_context('spawn')
+    for size in sizes:
+        with TemporaryDirectory(prefix='benchtiles-') as tempdir:
+            path = Path(tempdir) / 'slide.tiff'
+            write_slide(path, size, size, 0.5)
+            with ProcessPoolExecutor(1, mp_context=context) as executor:
+                count, elapsed, rss = executor.submit(
+                    _tile_slide, path, options
+                ).result()
+        print(
+            f'{size:>6} x {size:<6} {count:>7} tiles in {elapsed:6.1f} s, '
+            f'peak RSS {rss >> 10} MiB'
+        )
+
+
+def bench_encode(paths: list[Path], count: int) -> None:
+    """Compare tile size and encode time of each tile format and JPEG
+    effort, on up to count non-blank tiles from the highest-resolution
+    level of each slide.  With no slides, use a synthetic one."""
+    with TemporaryDirectory(prefix='benchtiles-') as tempdir:
+        if not paths:
+            paths = [Path(tempdir) / 'synthetic.tiff']
+            write_slide(paths[0], 10000, 10000, 0.5)
+        for path in paths:
+            generator = st.Generator(OpenSlide(path))
+            level = generator.dz.level_count - 1
+            cols, rows = generator.dz.level_tiles[level]
+            tiles = []
+            for tile in generator.get_tiles(
+                level,
+                [(col, row) for row in range(rows) for col in range(cols)],
+                st.StageTimes(),
+            ):
+                if tile is not None:
+                    tiles.append(tile)
+                    if len(tiles) == count:
+                        break
+            if not tiles:
+                print(f'{path.name}: no tiles')
+                continue
+            encoders = [
+                st.TileEncoder('jpeg', effort) for effort in st.JPEG_EFFORTS
+            ] + [
+                st.TileEncoder(format)
+                for format in st.TILE_FORMATS
+                if format != 'jpeg'
+            ]
+            for encoder in encoders:
+                name = encoder.format
+                if encoder.format == 'jpeg':
+                    name += f' {encoder.effort}'
+                size = 0
+                start = time.perf_counter()
+                for tile in tiles:
+                    size += len(encoder.encode(tile))
+                elapsed = time.perf_counter() - start
+                print(
+                    f'{path.name} {name:>16}: {len(tiles)} tiles, '
+                    f'{size / len(tiles) / 1e3:6.1f} kB/tile, '
+                    f'{1e3 * elapsed / len(tiles):6.2f} ms/tile'
+                )
+
+
+def _retile_slide(
+    ctx_path: Path,
+    slide_relpath: PurePath,
+    summary_dir: Path,
+    options: st.TileOptions,
+) -> tuple[float, int]:
+    """Retile a slide in a fresh process.  Return the elapsed time and the
+    peak RSS in KiB."""
+    st.DOWNLOAD_BASE_URL = (
+        f'{os.environ["AWS_ENDPOINT_URL"]}/{DOWNLOAD_BUCKET}/'
+    )
+    start = time.monotonic()
+    with ctx_path.open() as ctxfile:
+        st.retile_slide(ctxfile, slide_relpath, summary_dir, options)
+    elapsed = time.monotonic() - start
+    return elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def publish_slide(
+    tempdir: Path, size: int, sparsity: float, name: str | None = None
+) -> tuple[PurePath, st.TestDataSlide, int]:
+    """Create a synthetic slide and publish it for download.  Return its
+    path in the download bucket, its testdata info, and its tile count."""
+    slide_relpath = PurePath(f'Synthetic/{name or f"{size}-{sparsity}"}.tiff')
+    path = tempdir / slide_relpath.name
+    write_slide(path, size, size, 1 - sparsity)
+    with path.open('rb') as fh:
+        r = requests.put(
+            f'{os.environ["AWS_ENDPOINT_URL"]}/{DOWNLOAD_BUCKET}/'
+            f'{slide_relpath}',
+            data=fh,
+        )
+        r.raise_for_status()
+    with path.open('rb') as fh:
+        slide_sha256 = file_digest(fh, 'sha256').hexdigest()
+    slide_info: st.TestDataSlide = {
+        'description': f'{size} x {size} synthetic slide',
+        'format': 'Generic TIFF',
+        'license': 'CC0-1.0',
+        'sha256': slide_sha256,
+        'size': path.stat().st_size,
+    }
+    tiles = st.Generator(OpenSlide(path)).dz.tile_count
+    path.unlink()
+    return slide_relpath, slide_info, tiles
+
+
+def _retile_many(
+    ctx_path: Path,
+    matrix_path: Path,
+    summary_dir: Path,
+    options: st.TileOptions,
+) -> float:
+    """Retile a matrix of slides in a fresh process.  Return the elapsed
+    time."""
+    st.DOWNLOAD_BASE_URL = (
+        f'{os.environ["AWS_ENDPOINT_URL"]}/{DOWNLOAD_BUCKET}/'
+    )
+    start = time.monotonic()
+    with ctx_path.open() as ctxfile, matrix_path.open() as matrixfile:
+        st.retile_slides(ctxfile, summary_dir, options, matrixfile)
+    return time.monotonic() - start
+
+
+def bench_many(
+    sizes: list[int], sparsity: float, options: st.TileOptions
+) -> None:
+    """Retile a set of synthetic slides with one tile subcommand per
+    slide, and then with the tile-many subcommand, and report the total
+    time of each."""
+    context = multiprocessing.get_context('spawn')
+    with TemporaryDirectory(prefix='benchtiles-') as td:
+        tempdir = Path(td)
+        slides = {}
+        tiles = 0
+        for i, size in enumerate(sizes):
+            slide_relpath, slide_info, count = publish_slide(
+                tempdir, size, sparsity, f'{i}-{size}'
+            )
+            slides[slide_relpath.as_posix()] = slide_info
+            tiles += count
+        matrix_path = tempdir / 'matrix'
+        matrix: st.Matrix = {'slide': sorted(slides)}
+        matrix_path.write_text(json.dumps(matrix))
+
+        for mode in 'tile', 'tile-many':
+            # a new stamp and bucket prefix, so every slide is retiled
+            ctx_path = tempdir / f'context-{mode}'
+            ctx: st.Context = {
+                'openslide': openslide.__library_version__,
+                'openslide_python': openslide.__version__,
+                'stamp': f'bench-{mode}',
+                'slides': slides,
+                'bucket': f'{BUCKET}-{mode}',
+                'formats': [st.FORMAT],
+                'pack': False,
+            }
+            ctx_path.write_text(json.dumps(ctx))
+            summary_dir = tempdir / f'summary-{mode}'
+            # a fresh process per slide, as in a CI matrix
+            with ProcessPoolExecutor(
+                1,
+                mp_context=context,
+                max_tasks_per_child=1 if mode == 'tile' else None,
+            ) as executor:
+                if mode == 'tile':
+                    start = time.monotonic()
+                    for name in matrix['slide']:
+                        executor.submit(
+                            _retile_slide,
+                            ctx_path,
+                            PurePath(name),
+                            summary_dir,
+                            options,
+                        ).result()
+                    elapsed = time.monotonic() - start
+                else:
+                    elapsed = executor.submit(
+                        _retile_many,
+                        ctx_path,
+                        matrix_path,
+                        summary_dir,
+                        options,
+                    ).result()
+            print(
+                f'{mode:>9}: {len(slides)} slides, {tiles} tiles in '
+                f'{elapsed:6.1f} s, {tiles / elapsed:7.1f} tiles/s'
+            )
+
+
+def bench_retile(
+    sizes: list[int],
+    sparsity: float,
+    noop: bool,
+    formats: list[str],
+    pack: bool,
+    options: st.TileOptions,
+) -> None:
+    """Retile synthetic slides in the specified formats and layout with
+    the tile subcommand and report the throughput, uploads, and peak
+    memory of each.  If noop is true, report a rerun with a new stamp,
+    which should reuse every tile."""
+    context = multiprocessing.get_context('spawn')
+    for size in sizes:
+        with TemporaryDirectory(prefix='benchtiles-') as tempdir:
+            slide_relpath, slide_info, tiles = publish_slide(
+                Path(tempdir), size, sparsity
+            )
+
+            # A no-op run needs a populated bucket and a changed stamp
+            stamps = ['bench-a', 'bench-b'] if noop else ['bench-a']
+            for stamp in stamps:
+                ctx_path = Path(tempdir) / f'context-{stamp}'
+                ctx: st.Context = {
+                    'openslide': openslide.__library_version__,
+                    'openslide_python': openslide.__version__,
+                    'stamp': stamp,
+                    'slides': {slide_relpath.as_posix(): slide_info},
+                    'bucket': BUCKET,
+                    'formats': formats,
+                    'pack': pack,
+                }
+                ctx_path.write_text(json.dumps(ctx))
+                before = get_stats()
+                with ProcessPoolExecutor(1, mp_context=context) as executor:
+                    elapsed, rss = executor.submit(
+                        _retile_slide,
+                        ctx_path,
+                        slide_relpath,
+                        Path(tempdir) / 'summary',
+                        options,
+                    ).result()
+                after = get_stats()
+                if stamp != stamps[-1]:
+                    continue
+                puts = after.get('put', 0) - before.get('put', 0)
+                put_bytes = after.get('put_bytes', 0) - before.get(
+                    'put_bytes', 0
+                )
+                mode = 'noop' if noop else 'full'
+                print(
+                    f'{mode} {size:>6} x {size:<6} {tiles:>7} tiles in '
+                    f'{elapsed:6.1f} s, {tiles / elapsed:7.1f} tiles/s, '
+                    f'{puts} PUTs, {put_bytes / 1e6:.1f} MB, '
+                    f'peak RSS {rss >> 10} MiB'
+                )
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument(
+        '--port',
+        type=int,
+        default=8642,
+        help='port for the S3 stand-in [8642]',
+    )
+    parser.add_argument(
+        '--latency',
+        metavar='SECONDS',
+        type=float,
+        default=0.02,
+        help='artificial latency of each S3 request [0.02]',
+    )
+    subparsers = parser.add_subparsers(metavar='subcommand', required=True)
+
+    parser_serve = subparsers.add_parser(
+        'serve', help='run the S3 stand-in in the foreground'
+    )
+    parser_serve.set_defaults(cmd='serve')
+
+    parser_upload = subparsers.add_parser(
+        'upload', help='benchmark tile uploaders'
+    )
+    parser_upload.add_argument(
+        '-n',
+        '--count',
+        type=int,
+        default=2000,
+        help='number of tiles to upload [2000]',
+    )
+    parser_upload.add_argument(
+        '-s',
+        '--size',
+        metavar='BYTES',
+        type=int,
+        default=30000,
+        help='size of each tile [30000]',
+    )
+    parser_upload.add_argument(
+        '-u',
+        '--upload-jobs',
+        metavar='COUNT',
+        dest='upload_workers',
+        type=int,
+        default=32,
+        help='number of concurrent uploads [32]',
+    )
+    parser_upload.set_defaults(cmd='upload')
+
+    parser_memory = subparsers.add_parser(
+        'memory', help='benchmark peak memory use by slide size'
+    )
+    parser_memory.add_argument(
+        'sizes',
+        metavar='PIXELS',
+        nargs='*',
+        type=int,
+        default=[10000, 20000, 40000],
+        help='width and height of each synthetic slide [10000 20000 40000]',
+    )
+    parser_memory.add_argument(
+        '-j',
+        '--jobs',
+        metavar='COUNT',
+        dest='workers',
+        type=int,
+        default=4,
+        help='number of tiling threads [4]',
+    )
+    parser_memory.add_argument(
+        '-u',
+        '--upload-jobs',
+        metavar='COUNT',
+        dest='upload_workers',
+        type=int,
+        default=32,
+        help='number of concurrent uploads [32]',
+    )
+    parser_memory.add_argument(
+        '--in-flight',
+        metavar='COUNT',
+        type=int,
+        help=(
+            'number of tile batches to render concurrently '
+            f'[{st.COMPUTE_QUEUE_DEPTH} per worker]'
+        ),
+    )
+    parser_memory.set_defaults(cmd='memory')
+
+    parser_encode = subparsers.add_parser(
+        'encode', help='benchmark tile formats and JPEG efforts'
+    )
+    parser_encode.add_argument(
+        'slides',
+        metavar='SLIDE',
+        nargs='*',
+        type=Path,
+        help='slide to take tiles from [a synthetic slide]',
+    )
+    parser_encode.add_argument(
+        '-n',
+        '--count',
+        type=int,
+        default=200,
+        help='maximum number of tiles per slide [200]',
+    )
+    parser_encode.set_defaults(cmd='encode')
+
+    parser_retile = subparsers.add_parser(
+        'retile', help='benchmark the tile subcommand on synthetic slides'
+    )
+    parser_retile.add_argument(
+        'sizes',
+        metavar='PIXELS',
+        nargs='*',
+        type=int,
+        default=[10000, 20000],
+        help='width and height of each synthetic slide [10000 20000]',
+    )
+    parser_retile.add_argument(
+        '-f',
+        '--format',
+        dest='formats',
+        action='append',
+        choices=st.TILE_FORMATS,
+        help=f'tile format; repeat to generate several [{st.FORMAT}]',
+    )
+    parser_retile.add_argument(
+        '--pack',
+        action='store_true',
+        help='store the tiles of each image in one object per format',
+    )
+    parser_retile.add_argument(
+        '-j',
+        '--jobs',
+        metavar='COUNT',
+        dest='workers',
+        type=int,
+        default=4,
+        help='number of tiling threads [4]',
+    )
+    parser_retile.add_argument(
+        '-n',
+        '--noop',
+        action='store_true',
+        help='measure a rerun that should reuse every tile',
+    )
+    parser_retile.add_argument(
+        '-s',
+        '--sparsity',
+        metavar='FRACTION',
+        type=float,
+        default=0.5,
+        help='fraction of each slide without tissue [0.5]',
+    )
+    parser_retile.add_argument(
+        '-u',
+        '--upload-jobs',
+        metavar='COUNT',
+        dest='upload_workers',
+        type=int,
+        default=32,
+        help='number of concurrent uploads [32]',
+    )
+    parser_retile.set_defaults(cmd='retile')
+
+    parser_many = subparsers.add_parser(
+        'many', help='benchmark the tile-many subcommand against tile'
+    )
+    parser_many.add_argument(
+        'sizes',
+        metavar='PIXELS',
+        nargs='*',
+        type=int,
+        default=[8000, 4000, 2000, 2000, 1000, 1000, 1000, 1000],
+        help=(
+            'width and height of each synthetic slide '
+            '[8000 4000 2000 2000 1000 1000 1000 1000]'
+        ),
+    )
+    parser_many.add_argument(
+        '-j',
+        '--jobs',
+        metavar='COUNT',
+        dest='workers',
+        type=int,
+        default=4,
+        help='number of tiling threads [4]',
+    )
+    parser_many.add_argument(
+        '-P',
+        '--processes',
+        action='store_true',
+        help='render tiles in worker processes rather than threads',
+    )
+    parser_many.add_argument(
+        '-s',
+        '--sparsity',
+        metavar='FRACTION',
+        type=float,
+        default=0.5,
+        help='fraction of each slide without tissue [0.5]',
+    )
+    parser_many.add_argument(
+        '-u',
+        '--upload-jobs',
+        metavar='COUNT',
+        dest='upload_workers',
+        type=int,
+        default=32,
+        help='number of concurrent uploads [32]',
+    )
+    parser_many.set_defaults(cmd='many')
+
+    args = parser.parse_args()
+    if args.cmd == 'serve':
+        serve(args.port, args.latency)
+    elif args.cmd == 'upload':
+        with stand_in(args.port, args.latency):
+            bench_upload(args.count, args.size, args.upload_workers)
+    elif args.cmd == 'memory':
+        with stand_in(args.port, args.latency):
+            bench_memory(
+                args.sizes,
+                st.TileOptions(
+                    args.workers, args.upload_workers, in_flight=args.in_flight
+                ),
+            )
+    elif args.cmd == 'encode':
+        bench_encode(args.slides, args.count)
+    elif args.cmd == 'retile':
+        with stand_in(args.port, args.latency):
+            bench_retile(
+                args.sizes,
+                args.sparsity,
+                args.noop,
+                args.formats or [st.FORMAT],
+                args.pack,
+                st.TileOptions(args.workers, args.upload_workers),
+            )
+    elif args.cmd == 'many':
+        with stand_in(args.port, args.latency):
+            bench_many(
+                args.sizes,
+                args.sparsity,
+                st.TileOptions(
+                    args.workers, args.upload_workers, args.processes
+                ),
+            )
+    else:
+        raise st.SyncError('unimplemented subcommand')
@@ -22,26 +22,50 @@ from __future__ import annotations
 
 from argparse import ArgumentParser, FileType
 from array import array
+import asyncio
+from asyncio import StreamReader, StreamWriter
 import base64
-from collections.abc import Callable, Iterator
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import OrderedDict, deque
+from collections.abc import Iterable, Iterator, Mapping, Sequence
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from contextlib import contextmanager
 from dataclasses import dataclass
+from functools import partial
 import gzip
 from hashlib import md5, sha256
+import heapq
 from io import BytesIO
 import json
+import math
 import os
 from pathlib import Path, PurePath
+import random
 import re
+import ssl
 import sys
 from tempfile import TemporaryDirectory
+from threading import BoundedSemaphore, Lock, Thread
+import time
+import traceback
 from typing import TYPE_CHECKING, Any, NotRequired, Self, TextIO, TypedDict
 from unicodedata import normalize
-from urllib.parse import urljoin
+from urllib.parse import SplitResult, urljoin, urlsplit
 from zipfile import ZipFile
 import zlib
 
 import boto3
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+import numpy as np
+from numpy.typing import NDArray
 import openslide
 from openslide import (
     AbstractSlide,
@@ -51,15 +75,22 @@ from openslide import (
     OpenSlideError,
 )
 from openslide.deepzoom import DeepZoomGenerator
+import PIL
 from PIL import ImageCms
+import PIL.Image
 from PIL.Image import Image
 from PIL.ImageCms import ImageCmsProfile
 import requests
+from requests.adapters import HTTPAdapter
 
 if TYPE_CHECKING:
-    from mypy_boto3_s3.service_resource import Object
+    from mypy_boto3_s3.service_resource import MultipartUpload, Object
+    from mypy_boto3_s3.type_defs import CompletedPartTypeDef
 
-STAMP_VERSION = 'sparse'  # change to retile without OpenSlide version bump
+# change to rewrite slide metadata without OpenSlide version bump; stored
+# tiles are still reused unless the tiling fingerprint changes
+STAMP_VERSION = 'sparse'
+TILING_VERSION = 'blocks'  # change to re-render tiles after renderer changes
 CORS_ORIGINS = ['*']
 DOWNLOAD_BASE_URL = 'https://openslide.cs.cmu.edu/download/openslide-testdata/'
 DOWNLOAD_INDEX = 'index.json'
@@ -68,11 +99,43 @@ METADATA_NAME = 'info.json'
 STATUS_NAME = 'status.json'
 SLIDE_PROPERTIES_NAME = 'properties.json'
 SLIDE_METADATA_NAME = 'slide.json'
-FORMAT = 'jpeg'
+SLIDE_MANIFEST_NAME = 'manifest.json'
+TIMINGS_SUFFIX = '.timings.json'
+FORMAT = 'jpeg'  # default tile format
 QUALITY = 75
-TILE_SIZE = 510
+JPEG_EFFORT = 'optimize'  # trade-off between encode time and size
+WEBP_QUALITY = 75
+AVIF_QUALITY = 60
+AVIF_SPEED = 8  # 0-10; the default of 6 is an order of magnitude slower
+TILE_SIZE = 510  # even, so DERIVE_LEVELS can halve tiles exactly
 OVERLAP = 1
 LIMIT_BOUNDS = True
+DERIVE_LEVELS = True  # downsample tiles when no slide level is closer
+TILE_BLOCK = 6  # width and height of a block of tiles in a work unit
+ROW_READ_TILES = 2 * TILE_BLOCK  # max tiles cut from one read_region()
+BLANK_TOLERANCE = 8  # max difference from white of a background pixel
+BLANK_FRACTION = 0.999  # min fraction of background pixels in a blank tile
+BLANK_CHECK_SIZE = 256  # pixels per block side in low-res blank checks
+WORKER_CACHE_SIZE = 16 << 20  # OpenSlide cache per worker, if not estimated
+MAX_WORKER_CACHE_SIZE = 256 << 20
+MAX_CACHE_FRACTION = 0.25  # of physical memory, for all workers' caches
+MAX_CACHE_SIZE = 8 << 30  # for all workers' caches
+COMPUTE_QUEUE_DEPTH = 2  # tile batches in flight per compute worker
+UPLOAD_QUEUE_DEPTH = 4  # tiles queued per concurrent upload
+UPLOAD_ATTEMPTS = 5
+PACK_PART_SIZE = 8 << 20  # multipart upload part size for packed tiles
+PACK_UPLOAD_WORKERS = 4  # concurrent part uploads per packed image
+PRUNE_BATCH_SIZE = 1000  # max keys per DeleteObjects request
+PRUNE_WORKERS = 8  # concurrent delete requests per slide
+FETCH_CHUNK_SIZE = 16 << 20
+FETCH_WORKERS = 8
+FETCH_ATTEMPTS = 3
+METADATA_FETCH_WORKERS = 32  # concurrent slide.json reads when starting
+# rough retiling costs, for balancing shards
+SHARD_SLIDE_SECONDS = 30  # per-slide overhead
+SHARD_TILE_RATE = 40  # tiles per second
+SHARD_FETCH_RATE = 50 << 20  # download bytes per second
+SHARD_BYTES_PER_TILE = 50000  # slide bytes per tile, if not learned
 GROUP_NAME_MAP = {
     'Argos': 'ARGOS',
     'Generic-TIFF': 'Generic TIFF',
@@ -87,6 +150,19 @@ BUCKET_STATIC = {
         'content-type': 'text/plain',
     },
 }
+# Pillow JPEG options for each JPEG_EFFORT.  Optimized Huffman tables
+# shrink tiles without changing their pixels.
+JPEG_EFFORTS: dict[str, dict[str, bool]] = {
+    'baseline': {},
+    'optimize': {'optimize': True},
+    'progressive': {'optimize': True, 'progressive': True},
+}
+# Pillow save options for each tile format
+TILE_FORMATS: dict[str, dict[str, Any]] = {
+    'jpeg': {'quality': QUALITY},
+    'webp': {'quality': WEBP_QUALITY},
+    'avif': {'quality': AVIF_QUALITY, 'speed': AVIF_SPEED},
+}
 CACHE_CONTROL_NOCACHE = 'no-cache'
 CACHE_CONTROL_CACHE = 'public, max-age=31536000'
 
@@ -133,12 +209,19 @@ class Context(TypedDict):
     stamp: str
     slides: TestDataIndex
     bucket: str
+    formats: list[str]
+    pack: bool
+    shards: NotRequired[list[list[str]]]  # slides for each matrix shard
+    # packed tiles referenced by the published info.json, by slide
+    published_packs: NotRequired[dict[str, str]]
 
 
 class Matrix(TypedDict):
-    """Job matrix for GitHub Actions."""
+    """Job matrix for GitHub Actions, with a job per slide or per shard
+    of slides."""
 
-    slide: list[str]
+    slide: NotRequired[list[str]]
+    shard: NotRequired[list[int]]
 
 
 class SlideMetadata(TypedDict):
@@ -152,6 +235,14 @@ class SlideMetadata(TypedDict):
     properties_url: NotRequired[str]
 
 
+class KeyManifest(TypedDict):
+    """Per-slide manifest.json listing tile keys and their MD5s."""
+
+    stamp: str
+    fingerprint: NotRequired[str]
+    keys: dict[str, str]
+
+
 class BucketMetadata(TypedDict):
     """Bucket info.json, for the frontend."""
 
@@ -179,8 +270,11 @@ class SlideSummary(TypedDict):
 class ImageInfo(TypedDict):
     name: str | None
     mpp: float | None
-    source: DzSource
+    source: DzSource  # first of sources
+    sources: list[DzSource]  # in order of preference
     sparse: dict[str, SparseLevel]
+    # tiles are in {Url}{pack}.pack, at byte ranges from {Url}{pack}.index
+    pack: NotRequired[str]
 
 
 class SparseLevel(TypedDict):
@@ -206,6 +300,26 @@ class DzSourceImageSize(TypedDict):
     Height: int
 
 
+class FetchState(TypedDict):
+    """Resume state for a partial slide download."""
+
+    sha256: str
+    chunk_size: int
+    done: list[int]
+
+
+class StageStats(TypedDict):
+    count: int
+    seconds: float
+    histogram: list[int]
+
+
+class SlideTimings(TypedDict):
+    stages: dict[str, float]
+    # image -> DZ level -> stage
+    images: dict[str, dict[str, dict[str, StageStats]]]
+
+
 class StatusMetadata(TypedDict):
     """status.json object for the frontend."""
 
@@ -223,47 +337,602 @@ def slugify(text: str) -> str:
     return re.sub('[^a-z0-9]+', '_', text)
 
 
+def background_mask(pixels: NDArray[np.uint8]) -> NDArray[np.bool_]:
+    """Return a mask of the near-white pixels in an RGB array."""
+    mask: NDArray[np.bool_] = pixels[..., :3].min(axis=-1) >= (
+        255 - BLANK_TOLERANCE
+    )
+    return mask
+
+
+class StageTimes:
+    """Histograms of the time taken by each stage of tiling, per DZ level.
+    Histogram bucket i counts durations from 2**i to 2**(i + 1)
+    microseconds."""
+
+    def __init__(self) -> None:
+        self._stats: dict[int, dict[str, StageStats]] = {}
+
+    def add(self, level: int, stage: str, seconds: float) -> None:
+        stats = self._stats.setdefault(level, {}).setdefault(
+            stage, {'count': 0, 'seconds': 0, 'histogram': []}
+        )
+        stats['count'] += 1
+        stats['seconds'] += seconds
+        bucket = max(int(seconds * 1e6), 1).bit_length() - 1
+        histogram = stats['histogram']
+        histogram.extend([0] * (bucket + 1 - len(histogram)))
+        histogram[bucket] += 1
+
+    @contextmanager
+    def timed(self, level: int, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(level, stage, time.perf_counter() - start)
+
+    def update(self, other: StageTimes) -> None:
+        """Merge another set of histograms into this one."""
+        for level, stages in other._stats.items():
+            for stage, other_stats in stages.items():
+                stats = self._stats.setdefault(level, {}).setdefault(
+                    stage, {'count': 0, 'seconds': 0, 'histogram': []}
+                )
+                stats['count'] += other_stats['count']
+                stats['seconds'] += other_stats['seconds']
+                histogram = stats['histogram']
+                histogram.extend(
+                    [0] * (len(other_stats['histogram']) - len(histogram))
+                )
+                for bucket, count in enumerate(other_stats['histogram']):
+                    histogram[bucket] += count
+
+    def save(self) -> dict[str, dict[str, StageStats]]:
+        return {
+            str(level): stages
+            for level, stages in sorted(self._stats.items(), reverse=True)
+        }
+
+
+class CacheModel:
+    """An estimate of the hit rate of a slide's OpenSlide cache.
+
+    OpenSlide doesn't report cache statistics, so replay each read against
+    an LRU cache of the same capacity, holding the slide tiles that the
+    read covers.  Only slide levels with known tile sizes are modeled."""
+
+    def __init__(self, slide: AbstractSlide, capacity: int):
+        self._tile_sizes: dict[int, tuple[int, int]] = {}
+        for level in range(slide.level_count):
+            prefix = f'openslide.level[{level}]'
+            if f'{prefix}.tile-width' in slide.properties:
+                self._tile_sizes[level] = (
+                    int(slide.properties[f'{prefix}.tile-width']),
+                    int(slide.properties[f'{prefix}.tile-height']),
+                )
+        self._downsamples = slide.level_downsamples
+        self._capacity = capacity
+        self._used = 0
+        self._entries: OrderedDict[tuple[int, int, int], int] = OrderedDict()
+        # DZ level -> [hits, misses]
+        self._counts: dict[int, list[int]] = {}
+        self._lock = Lock()
+
+    def read(
+        self,
+        dz_level: int,
+        location: tuple[float, float],
+        slide_level: int,
+        size: tuple[int, int],
+    ) -> None:
+        """Record a read_region() call made while rendering a DZ level."""
+        tile_size = self._tile_sizes.get(slide_level)
+        if tile_size is None:
+            return
+        tile_width, tile_height = tile_size
+        downsample = self._downsamples[slide_level]
+        x = int(location[0] / downsample)
+        y = int(location[1] / downsample)
+        with self._lock:
+            counts = self._counts.setdefault(dz_level, [0, 0])
+            for row in range(
+                y // tile_height, (y + size[1] - 1) // tile_height + 1
+            ):
+                for col in range(
+                    x // tile_width, (x + size[0] - 1) // tile_width + 1
+                ):
+                    key = (slide_level, col, row)
+                    if key in self._entries:
+                        self._entries.move_to_end(key)
+                        counts[0] += 1
+                        continue
+                    counts[1] += 1
+                    self._entries[key] = 4 * tile_width * tile_height
+                    self._used += self._entries[key]
+                    while self._used > self._capacity:
+                        self._used -= self._entries.popitem(last=False)[1]
+
+    def take_counts(self) -> dict[int, tuple[int, int]]:
+        """Return and reset the hits and misses for each DZ level."""
+        with self._lock:
+            counts, self._counts = self._counts, {}
+        return {
+            level: (hits, misses) for level, (hits, misses) in counts.items()
+        }
+
+
+# Shared color transforms, by profile hash and use of a lookup table
+_color_transforms: dict[tuple[str, bool], ColorTransform] = {}
+_color_transforms_lock = Lock()
+
+
+class ColorTransform:
+    """A conversion from an ICC profile to sRGB.  Building a transform is
+    slow, so transforms are cached by profile hash and shared by every
+    image with the same profile; use for_profile().
+
+    If lut is true, the conversion of every 8-bit RGB color is precomputed
+    into a 48 MiB lookup table and applied with NumPy, which gives the same
+    results as LittleCMS."""
+
+    def __init__(self, profile: ImageCmsProfile, lut: bool = False) -> None:
+        intent: int = ImageCms.getDefaultIntent(profile)  # type: ignore[no-untyped-call]
+        self._transform = ImageCms.buildTransform(
+            profile, SRGB_PROFILE, 'RGB', 'RGB', intent, 0
+        )
+        self._lut: NDArray[np.uint8] | None = None
+        if lut:
+            # convert an image of every color, in index order
+            channel = np.arange(256, dtype=np.uint8)
+            colors = np.empty((256, 256, 256, 3), np.uint8)
+            colors[..., 0] = channel[:, None, None]
+            colors[..., 1] = channel[None, :, None]
+            colors[..., 2] = channel
+            image = PIL.Image.fromarray(colors.reshape(4096, 4096, 3))
+            del colors
+            ImageCms.applyTransform(image, self._transform, True)
+            self._lut = np.asarray(image).reshape(-1, 3)
+
+    @classmethod
+    def for_profile(
+        cls, profile: ImageCmsProfile, lut: bool = False
+    ) -> ColorTransform:
+        """Return the shared transform for a profile, building it if
+        necessary."""
+        key = (sha256(profile.tobytes()).hexdigest(), lut)  # type: ignore[no-untyped-call]
+        with _color_transforms_lock:
+            transform = _color_transforms.get(key)
+            if transform is None:
+                transform = _color_transforms[key] = cls(profile, lut)
+        return transform
+
+    def apply(self, img: Image) -> Image:
+        """Convert an RGB image to sRGB, in place unless using a lookup
+        table, and return it."""
+        if self._lut is None:
+            ImageCms.applyTransform(img, self._transform, True)
+        else:
+            img = PIL.Image.fromarray(self.apply_array(np.asarray(img)))
+        # Some browsers assume we intend the display's color space if we
+        # don't embed the profile.  Pillow's serialization is larger, so
+        # use ours.
+        img.info['icc_profile'] = SRGB_PROFILE_BYTES
+        return img
+
+    def apply_array(self, pixels: NDArray[np.uint8]) -> NDArray[np.uint8]:
+        """Convert an array of RGB pixels of any shape, such as a stack of
+        tiles, with the lookup table."""
+        assert self._lut is not None
+        index = (
+            pixels[..., 0].astype(np.uint32) << 16
+            | pixels[..., 1].astype(np.uint32) << 8
+            | pixels[..., 2]
+        )
+        converted: NDArray[np.uint8] = self._lut[index]
+        return converted
+
+
+class TileEncoder:
+    """Encodes tiles in one format with fixed settings.  format is a key of
+    TILE_FORMATS and effort of JPEG_EFFORTS.  Pillow doesn't keep
+    compressors between calls, so the save options are resolved once and
+    reused for every tile."""
+
+    def __init__(self, format: str = FORMAT, effort: str = JPEG_EFFORT):
+        if format not in TILE_FORMATS:
+            raise SyncError(f'Unknown tile format {format}')
+        if effort not in JPEG_EFFORTS:
+            raise SyncError(f'Unknown JPEG effort {effort}')
+        self.format = format
+        self.content_type = f'image/{format}'
+        self.effort = effort
+        self._options: dict[str, Any] = {
+            **TILE_FORMATS[format],
+            **(JPEG_EFFORTS[effort] if format == 'jpeg' else {}),
+        }
+
+    def encode(self, tile: Image) -> bytes:
+        buf = BytesIO()
+        tile.save(
+            buf,
+            self.format,
+            icc_profile=tile.info.get('icc_profile'),
+            **self._options,
+        )
+        return buf.getvalue()
+
+
 class Generator:
-    def __init__(self, slide: AbstractSlide):
+    def __init__(
+        self,
+        slide: AbstractSlide,
+        cache_size: int | None = None,
+        color_lut: bool = False,
+        formats: Sequence[str] = (FORMAT,),
+    ):
+        """If cache_size is specified, it's the capacity of the slide's
+        OpenSlide cache, and cache hits are estimated.  If color_lut is
+        true, convert tiles to sRGB with a lookup table.  Tiles are encoded
+        in each of the specified formats."""
         self.dz = DeepZoomGenerator(
             slide, TILE_SIZE, OVERLAP, limit_bounds=LIMIT_BOUNDS
         )
-        self._transform = self._get_transform(slide)
+        self._slide = slide
+        self.encoders = [TileEncoder(format) for format in formats]
+        self.cache = (
+            CacheModel(slide, cache_size) if cache_size is not None else None
+        )
+        if LIMIT_BOUNDS:
+            self._l0_offset = (
+                int(slide.properties.get(openslide.PROPERTY_NAME_BOUNDS_X, 0)),
+                int(slide.properties.get(openslide.PROPERTY_NAME_BOUNDS_Y, 0)),
+            )
+        else:
+            self._l0_offset = (0, 0)
+        self._transform = (
+            ColorTransform.for_profile(slide.color_profile, color_lut)
+            if slide.color_profile is not None
+            else None
+        )
+        # A DZ level is derived from the next higher-resolution level if
+        # OpenSlide would read both from the same slide level
+        self._slide_levels = [
+            slide.get_best_level_for_downsample(
+                2 ** (self.dz.level_count - level - 1)
+            )
+            for level in range(self.dz.level_count)
+        ]
+        self.derived = [
+            DERIVE_LEVELS
+            and level + 1 < self.dz.level_count
+            and self._slide_levels[level] == self._slide_levels[level + 1]
+            for level in range(self.dz.level_count)
+        ]
+        # A DZ level is unscaled if it has the resolution of its slide
+        # level, so adjacent tiles can be cut from a single read
+        self._unscaled = [
+            2 ** (self.dz.level_count - level - 1)
+            == slide.level_downsamples[self._slide_levels[level]]
+            for level in range(self.dz.level_count)
+        ]
+        self._background_color = '#' + slide.properties.get(
+            openslide.PROPERTY_NAME_BACKGROUND_COLOR, 'ffffff'
+        )
+        self._background = self.to_srgb(
+            PIL.Image.new('RGB', (1, 1), self._background_color)
+        )
+
+    def to_srgb(self, img: Image) -> Image:
+        """Convert an image to sRGB, possibly in place, and return it."""
+        if self._transform is None:
+            return img
+        return self._transform.apply(img)
 
     @staticmethod
-    def _get_transform(image: AbstractSlide) -> Callable[[Image], None]:
-        """Return a function that transforms an image to sRGB in place."""
-        if image.color_profile is None:
-            return lambda img: None
-        intent: int = ImageCms.getDefaultIntent(image.color_profile)  # type: ignore[no-untyped-call]
-        transform = ImageCms.buildTransform(
-            image.color_profile, SRGB_PROFILE, 'RGB', 'RGB', intent, 0
-        )
-
-        def xfrm(img: Image) -> None:
-            ImageCms.applyTransform(img, transform, True)
-            # Some browsers assume we intend the display's color space if we
-            # don't embed the profile.  Pillow's serialization is larger, so
-            # use ours.
-            img.info['icc_profile'] = SRGB_PROFILE_BYTES
-
-        return xfrm
-
-    def get_tile(self, level: int, address: tuple[int, int]) -> Image:
-        tile: Image = self.dz.get_tile(level, address)
-        self._transform(tile)
+    def is_blank(tile: Image | NDArray[np.uint8]) -> bool:
+        """Return True if a tile is almost entirely background."""
+        mask = background_mask(np.asarray(tile))
+        return bool(np.count_nonzero(mask) >= BLANK_FRACTION * mask.size)
+
+    def get_tile(
+        self, level: int, address: tuple[int, int], times: StageTimes
+    ) -> Image | None:
+        """Return a tile converted to sRGB, or None if it's blank."""
+        if self.cache is not None:
+            # DeepZoomGenerator reads the tile's bounds from slide_level
+            x0, y0, x1, y1 = self._tile_bounds(level, address)
+            dz_downsample = 2 ** (self.dz.level_count - level - 1)
+            slide_level = self._slide_levels[level]
+            scale = dz_downsample / self._slide.level_downsamples[slide_level]
+            self.cache.read(
+                level,
+                (
+                    self._l0_offset[0] + x0 * dz_downsample,
+                    self._l0_offset[1] + y0 * dz_downsample,
+                ),
+                slide_level,
+                (math.ceil((x1 - x0) * scale), math.ceil((y1 - y0) * scale)),
+            )
+        with times.timed(level, 'read'):
+            tile: Image = self.dz.get_tile(level, address)
+        with times.timed(level, 'blank'):
+            if self.is_blank(tile):
+                return None
+        with times.timed(level, 'transform'):
+            return self.to_srgb(tile)
+
+    def get_tiles(
+        self,
+        level: int,
+        addresses: Sequence[tuple[int, int]],
+        times: StageTimes,
+    ) -> Iterator[Image | None]:
+        """Yield the tiles at the specified addresses, converted to sRGB, or
+        None for blank ones.  At unscaled levels, read each run of adjacent
+        tiles in a row with one read_region() call and cut the tiles from
+        it, so slide tiles along tile borders are only decoded once.  Runs
+        are split every ROW_READ_TILES tiles, so blocks spanning a wide
+        level don't read a whole row of the level at once.  The results
+        match get_tile()."""
+        if not self._unscaled[level]:
+            for address in addresses:
+                yield self.get_tile(level, address, times)
+            return
+        start = 0
+        while start < len(addresses):
+            col, row = addresses[start]
+            end = start + 1
+            while (
+                end < len(addresses)
+                and end - start < ROW_READ_TILES
+                and addresses[end] == (col + end - start, row)
+            ):
+                end += 1
+            yield from self._get_row(level, addresses[start:end], times)
+            start = end
+
+    def _get_row(
+        self,
+        level: int,
+        addresses: Sequence[tuple[int, int]],
+        times: StageTimes,
+    ) -> Iterator[Image | None]:
+        """Yield a run of adjacent tiles in a row of an unscaled level,
+        from a single read."""
+        # read_region() arguments of each tile
+        coords = [self.dz.get_tile_coordinates(level, a) for a in addresses]
+        (x0, y0), slide_level, (_, height) = coords[0]
+        (x1, _), _, (last_width, _) = coords[-1]
+        downsample = int(self._slide.level_downsamples[slide_level])
+        size = ((x1 - x0) // downsample + last_width, height)
+        if self.cache is not None:
+            self.cache.read(level, (x0, y0), slide_level, size)
+        with times.timed(level, 'read'):
+            region = self._slide.read_region((x0, y0), slide_level, size)
+            profile = region.info.get('icc_profile')
+            image = self._flatten(region)
+            pixels = np.asarray(image)
+        for address, ((x, _), _, tile_size) in zip(
+            addresses, coords, strict=True
+        ):
+            if tile_size != self.dz.get_tile_dimensions(level, address):
+                # clipped by the slide bounds and scaled by get_tile()
+                yield self.get_tile(level, address, times)
+                continue
+            left = (x - x0) // downsample
+            with times.timed(level, 'blank'):
+                blank = self.is_blank(pixels[:, left : left + tile_size[0]])
+            if blank:
+                yield None
+                continue
+            tile = image.crop((left, 0, left + tile_size[0], height))
+            if profile is not None:
+                tile.info['icc_profile'] = profile
+            with times.timed(level, 'transform'):
+                tile = self.to_srgb(tile)
+            yield tile
+
+    def _flatten(self, region: Image) -> Image:
+        """Composite an RGBA region onto the slide's background color, as
+        DeepZoomGenerator does."""
+        if region.getchannel('A').getextrema() == (255, 255):  # type: ignore[no-untyped-call]
+            # opaque, so compositing would only drop the alpha channel
+            return region.convert('RGB')
+        return PIL.Image.composite(
+            region,
+            PIL.Image.new('RGB', region.size, self._background_color),
+            region,
+        )
+
+    def _tile_bounds(
+        self, level: int, address: tuple[int, int]
+    ) -> tuple[int, int, int, int]:
+        """Return the DZ level coordinates of a tile, including overlap."""
+        cols, rows = self.dz.level_tiles[level]
+        width, height = self.dz.level_dimensions[level]
+        col, row = address
+        return (
+            col * TILE_SIZE - OVERLAP * (col > 0),
+            row * TILE_SIZE - OVERLAP * (row > 0),
+            min((col + 1) * TILE_SIZE, width) + OVERLAP * (col < cols - 1),
+            min((row + 1) * TILE_SIZE, height) + OVERLAP * (row < rows - 1),
+        )
+
+    def halve(
+        self, level: int, address: tuple[int, int], tile: Image
+    ) -> Image:
+        """Return the area of a tile without overlap, downsampled by 2."""
+        x0, y0, _, _ = self._tile_bounds(level, address)
+        width, height = self.dz.level_dimensions[level]
+        x = address[0] * TILE_SIZE
+        y = address[1] * TILE_SIZE
+        return tile.crop(
+            (
+                x - x0,
+                y - y0,
+                min(x + TILE_SIZE, width) - x0,
+                min(y + TILE_SIZE, height) - y0,
+            )
+        ).reduce(2)
+
+    def compose(
+        self,
+        level: int,
+        address: tuple[int, int],
+        halves: Mapping[tuple[int, int], Image],
+    ) -> Image:
+        """Assemble a tile from the halved tiles of the next
+        higher-resolution level.  Missing tiles are filled with the
+        background color."""
+        x0, y0, x1, y1 = self._tile_bounds(level, address)
+        tile = PIL.Image.new(
+            'RGB', (x1 - x0, y1 - y0), self._background.getpixel((0, 0))
+        )
+        tile.info.update(self._background.info)
+        for (col, row), half in halves.items():
+            tile.paste(
+                half, (col * TILE_SIZE // 2 - x0, row * TILE_SIZE // 2 - y0)
+            )
         return tile
 
+    def block_shape(self, level: int) -> tuple[int, int]:
+        """Return the width and height, in tiles, of a block of work at a
+        DZ level.  Where the slide level's tile size is known, cover at
+        least one slide tile in each direction, so that strips and wide
+        tiles are decoded by as few workers as possible.  Derived levels
+        don't read the slide, so use short rows, which let TileScheduler
+        release halved tiles sooner and limit the assembled tiles in
+        flight."""
+        cols, rows = self.dz.level_tiles[level]
+        if self.derived[level]:
+            return min(TILE_BLOCK, cols), 1
+        width = height = TILE_BLOCK
+        slide_level = self._slide_levels[level]
+        prefix = f'openslide.level[{slide_level}]'
+        if f'{prefix}.tile-width' in self._slide.properties:
+            # DZ level pixels per slide level pixel
+            scale = self._slide.level_downsamples[slide_level] / 2 ** (
+                self.dz.level_count - level - 1
+            )
+            slide_cols = math.ceil(
+                int(self._slide.properties[f'{prefix}.tile-width'])
+                * scale
+                / TILE_SIZE
+            )
+            slide_rows = math.ceil(
+                int(self._slide.properties[f'{prefix}.tile-height'])
+                * scale
+                / TILE_SIZE
+            )
+            # keep about TILE_BLOCK ** 2 tiles per block
+            if slide_cols >= slide_rows:
+                width = max(slide_cols, TILE_BLOCK)
+                height = max(slide_rows, TILE_BLOCK**2 // width)
+            else:
+                height = max(slide_rows, TILE_BLOCK)
+                width = max(slide_cols, TILE_BLOCK**2 // height)
+        return max(min(width, cols), 1), max(min(height, rows), 1)
+
+    def worker_cache_size(self) -> int:
+        """Estimate the OpenSlide cache needed by one compute worker, so
+        that each slide tile is decoded once while rendering a block: one
+        row of DZ tiles, plus the slide tiles shared with the next row."""
+        size = 0
+        for level in range(self.dz.level_count):
+            slide_level = self._slide_levels[level]
+            prefix = f'openslide.level[{slide_level}]'
+            if (
+                self.derived[level]
+                or f'{prefix}.tile-width' not in self._slide.properties
+            ):
+                continue
+            tile_width = int(self._slide.properties[f'{prefix}.tile-width'])
+            tile_height = int(self._slide.properties[f'{prefix}.tile-height'])
+            # slide level pixels per DZ level pixel
+            scale = (
+                2 ** (self.dz.level_count - level - 1)
+                / self._slide.level_downsamples[slide_level]
+            )
+            cols = (
+                math.ceil(
+                    self.block_shape(level)[0] * TILE_SIZE * scale / tile_width
+                )
+                + 1
+            )
+            rows = (
+                math.ceil((TILE_SIZE + 2 * OVERLAP) * scale / tile_height) + 1
+            )
+            size = max(size, 4 * cols * rows * tile_width * tile_height)
+        return min(size or WORKER_CACHE_SIZE, MAX_WORKER_CACHE_SIZE)
+
+    def find_blank_tiles(
+        self,
+        level: int,
+        addresses: Sequence[tuple[int, int]],
+        times: StageTimes,
+    ) -> set[tuple[int, int]]:
+        """Return the subset of addresses that are entirely background in
+        a single low-resolution read of the region they cover.  Features
+        too small to survive in the slide's downsampled levels are missed.
+        Return an empty set if the slide has no suitable level to read
+        from."""
+        if len(addresses) < 2:
+            return set()
+        dz_width, dz_height = self.dz.level_dimensions[level]
+        x0 = min(col for col, _ in addresses) * TILE_SIZE
+        y0 = min(row for _, row in addresses) * TILE_SIZE
+        x1 = min((max(col for col, _ in addresses) + 1) * TILE_SIZE, dz_width)
+        y1 = min((max(row for _, row in addresses) + 1) * TILE_SIZE, dz_height)
+        # level 0 pixels per DZ level pixel
+        dz_downsample = 2 ** (self.dz.level_count - level - 1)
+        slide_level = self._slide.get_best_level_for_downsample(
+            dz_downsample
+            * min(max(x1 - x0, y1 - y0), TILE_BLOCK * TILE_SIZE)
+            / BLANK_CHECK_SIZE
+        )
+        # slide level pixels per DZ level pixel
+        scale = dz_downsample / self._slide.level_downsamples[slide_level]
+        size = (math.ceil((x1 - x0) * scale), math.ceil((y1 - y0) * scale))
+        if size[0] * size[1] > (4 * BLANK_CHECK_SIZE) ** 2:
+            return set()
+        location = (
+            self._l0_offset[0] + x0 * dz_downsample,
+            self._l0_offset[1] + y0 * dz_downsample,
+        )
+        if self.cache is not None:
+            self.cache.read(level, location, slide_level, size)
+        with times.timed(level, 'precheck'):
+            region = self._slide.read_region(location, slide_level, size)
+            # transparent areas are painted with the background color
+            mask = background_mask(np.asarray(self._flatten(region)))
+        blank = set()
+        for col, row in addresses:
+            # round outward so edge pixels count against both neighbors
+            left = math.floor((col * TILE_SIZE - x0) * scale)
+            top = math.floor((row * TILE_SIZE - y0) * scale)
+            right = math.ceil(
+                (min((col + 1) * TILE_SIZE, dz_width) - x0) * scale
+            )
+            bottom = math.ceil(
+                (min((row + 1) * TILE_SIZE, dz_height) - y0) * scale
+            )
+            if mask[top:bottom, left:right].all():
+                blank.add((col, row))
+        return blank
+
 
 class S3Storage:
-    def __init__(self, bucket_name: str) -> None:
-        self.conn = boto3.resource('s3')
+    def __init__(self, bucket_name: str, connections: int = 10) -> None:
+        self.conn = boto3.resource(
+            's3', config=Config(max_pool_connections=connections)
+        )
         self.bucket = self.conn.Bucket(bucket_name)
-        region = self.conn.meta.client.head_bucket(Bucket=bucket_name)[
+        self.region = self.conn.meta.client.head_bucket(Bucket=bucket_name)[
             'BucketRegion'
         ]
         self.base_url = (
-            f'https://{bucket_name}.s3.dualstack.{region}.amazonaws.com/'
+            f'https://{bucket_name}.s3.dualstack.{self.region}.amazonaws.com/'
         )
         self.NoSuchKey = self.conn.meta.client.exceptions.NoSuchKey
 
@@ -287,6 +956,212 @@ class S3Storage:
         )
 
 
+class ThreadUploader:
+    """Upload tiles with the boto3 resource API from a thread pool."""
+
+    def __init__(self, storage: S3Storage, workers: int) -> None:
+        self.storage = storage
+        self._exec = ThreadPoolExecutor(workers)
+
+    def submit(self, encoded: EncodedTile) -> Future[float]:
+        """Upload a tile, returning the seconds spent uploading."""
+        return self._exec.submit(self._upload, encoded)
+
+    def _upload(self, encoded: EncodedTile) -> float:
+        start = time.perf_counter()
+        encoded.upload(self.storage)
+        return time.perf_counter() - start
+
+    def shutdown(self, cancel_futures: bool = False) -> None:
+        self._exec.shutdown(cancel_futures=cancel_futures)
+
+
+class AsyncUploader:
+    """Upload tiles from an asyncio event loop on a dedicated thread.
+
+    Requests are presigned with botocore and sent over a pool of persistent
+    HTTP connections shared by all uploads.  Throttled and failed requests
+    are retried with exponential backoff and full jitter."""
+
+    def __init__(self, storage: S3Storage, connections: int) -> None:
+        self.storage = storage
+        self._client = boto3.client(
+            's3',
+            region_name=storage.region,
+            config=Config(signature_version='s3v4'),
+        )
+        self._slots = asyncio.Semaphore(connections)
+        self._idle: dict[
+            tuple[str, int], list[tuple[StreamReader, StreamWriter]]
+        ] = {}
+        self._ssl = ssl.create_default_context()
+        self._loop = asyncio.new_event_loop()
+        self._thread = Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+
+    def submit(self, encoded: EncodedTile) -> Future[float]:
+        """Upload a tile, returning the seconds spent in requests."""
+        return asyncio.run_coroutine_threadsafe(self._put(encoded), self._loop)
+
+    async def _put(self, encoded: EncodedTile) -> float:
+        path = encoded.key_name
+        data = encoded.data
+        params = {
+            'Bucket': self.storage.bucket.name,
+            'Key': path.as_posix(),
+            'CacheControl': CACHE_CONTROL_CACHE,
+            'ContentMD5': base64.b64encode(
+                bytes.fromhex(encoded.md5)
+            ).decode(),
+            'ContentType': encoded.content_type,
+        }
+        headers = {
+            'Cache-Control': params['CacheControl'],
+            'Content-MD5': params['ContentMD5'],
+            'Content-Type': params['ContentType'],
+        }
+        error = ''
+        elapsed = 0.0
+        for attempt in range(UPLOAD_ATTEMPTS):
+            if attempt:
+                # exponential backoff with full jitter
+                await asyncio.sleep(
+                    random.uniform(0, min(20, 0.1 * 2**attempt))
+                )
+            url = self._client.generate_presigned_url(
+                'put_object', Params=params, ExpiresIn=3600
+            )
+            try:
+                async with self._slots:
+                    start = time.perf_counter()
+                    try:
+                        status, body = await self._request(url, headers, data)
+                    finally:
+                        elapsed += time.perf_counter() - start
+            except (OSError, asyncio.IncompleteReadError) as e:
+                error = str(e)
+            else:
+                if status < 300:
+                    return elapsed
+                error = f'HTTP {status}: {body.decode(errors="replace")}'
+                if status not in (500, 502, 503, 504):
+                    break
+        raise OSError(f'Failed to upload {path}: {error}')
+
+    async def _request(
+        self, url: str, headers: dict[str, str], data: bytes
+    ) -> tuple[int, bytes]:
+        """Make an HTTP/1.1 PUT request on a pooled connection and return
+        the status and response body.  If a pooled connection fails, the
+        server may have closed it while idle, so retry once on a new
+        connection."""
+        parts = urlsplit(url)
+        assert parts.hostname is not None
+        https = parts.scheme == 'https'
+        host = (parts.hostname, parts.port or (443 if https else 80))
+        idle = self._idle.setdefault(host, [])
+        pooled = bool(idle)
+        while True:
+            if pooled:
+                reader, writer = idle.pop()
+            else:
+                reader, writer = await asyncio.open_connection(
+                    *host, ssl=self._ssl if https else None
+                )
+            try:
+                status, body, keep_alive = await self._exchange(
+                    reader, writer, parts, headers, data
+                )
+            except (OSError, asyncio.IncompleteReadError):
+                writer.close()
+                if pooled:
+                    pooled = False
+                    continue
+                raise
+            except BaseException:
+                writer.close()
+                raise
+            if keep_alive:
+                idle.append((reader, writer))
+            else:
+                writer.close()
+            return status, body
+
+    async def _exchange(
+        self,
+        reader: StreamReader,
+        writer: StreamWriter,
+        parts: SplitResult,
+        headers: dict[str, str],
+        data: bytes,
+    ) -> tuple[int, bytes, bool]:
+        """Send a PUT request on a connection and return the status,
+        response body, and whether the connection can be reused.  A
+        missing or malformed response is treated as a dropped
+        connection."""
+        request = [
+            f'PUT {parts.path}?{parts.query} HTTP/1.1',
+            f'Host: {parts.netloc}',
+            f'Content-Length: {len(data)}',
+            *(f'{k}: {v}' for k, v in headers.items()),
+            '',
+            '',
+        ]
+        writer.write('\r\n'.join(request).encode() + data)
+        await writer.drain()
+        try:
+            status = int((await reader.readline()).split()[1])
+            resp_headers = {}
+            while line := (await reader.readline()).strip():
+                k, v = line.decode('latin-1').split(':', 1)
+                resp_headers[k.lower()] = v.strip()
+            if resp_headers.get('transfer-encoding') == 'chunked':
+                chunks = []
+                while size := int((await reader.readline()).strip(), 16):
+                    chunks.append(await reader.readexactly(size))
+                    await reader.readline()
+                await reader.readline()
+                body = b''.join(chunks)
+            elif 'content-length' in resp_headers:
+                body = await reader.readexactly(
+                    int(resp_headers['content-length'])
+                )
+            else:
+                body = await reader.read()
+                resp_headers['connection'] = 'close'
+        except (IndexError, ValueError) as e:
+            raise ConnectionResetError(f'Malformed HTTP response: {e}') from e
+        return (
+            status,
+            body,
+            resp_headers.get('connection', '').lower() != 'close',
+        )
+
+    async def _close(self, cancel: bool) -> None:
+        tasks = asyncio.all_tasks() - {asyncio.current_task()}
+        if cancel:
+            for task in tasks:
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for conns in self._idle.values():
+            for _, writer in conns:
+                writer.close()
+        self._idle.clear()
+
+    def shutdown(self, cancel_futures: bool = False) -> None:
+        if self._loop.is_closed():
+            return
+        asyncio.run_coroutine_threadsafe(
+            self._close(cancel_futures), self._loop
+        ).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+Uploader = ThreadUploader | AsyncUploader
+
+
 class SparseMap:
     def __init__(self, generator: Generator):
         self._level_tiles = generator.dz.level_tiles
@@ -296,10 +1171,36 @@ class SparseMap:
             for level_tiles in self._level_tiles
         ]
 
+    @classmethod
+    def load(cls, generator: Generator, saved: dict[str, SparseLevel]) -> Self:
+        sparse_map = cls(generator)
+        for level, info in saved.items():
+            sparse_map._bitmaps[int(level)] = array(
+                'B', base64.b64decode(info['bitmap'])
+            )
+        return sparse_map
+
+    def get_bit(self, level: int, address: tuple[int, int]) -> bool:
+        bit = self._level_tiles[level][0] * address[1] + address[0]
+        return bool(self._bitmaps[level][bit >> 3] & (1 << (bit & 7)))
+
     def set_bit(self, level: int, address: tuple[int, int]) -> None:
         bit = self._level_tiles[level][0] * address[1] + address[0]
         self._bitmaps[level][bit >> 3] |= 1 << (bit & 7)
 
+    def children_sparse(self, level: int, address: tuple[int, int]) -> bool:
+        """Return True if every tile at the next higher-resolution level
+        that overlaps the specified tile is sparse."""
+        if level + 1 >= len(self._level_tiles):
+            return False
+        cols, rows = self._level_tiles[level + 1]
+        col, row = address
+        return all(
+            self.get_bit(level + 1, (child_col, child_row))
+            for child_row in range(2 * row, min(2 * row + 2, rows))
+            for child_col in range(2 * col, min(2 * col + 2, cols))
+        )
+
     def save(self) -> dict[str, SparseLevel]:
         return {
             str(level): {
@@ -311,131 +1212,1447 @@ class SparseMap:
         }
 
 
-@dataclass
+@dataclass(slots=True)
+class EncodedTile:
+    """A tile encoded in one format, whose stored copy is stale."""
+
+    key_name: PurePath
+    md5: str
+    data: bytes
+    content_type: str
+
+    def upload(self, storage: S3Storage) -> None:
+        storage.object(self.key_name).put(
+            Body=self.data,
+            CacheControl=CACHE_CONTROL_CACHE,
+            ContentMD5=base64.b64encode(bytes.fromhex(self.md5)).decode(),
+            ContentType=self.content_type,
+        )
+
+
+@dataclass(slots=True)
+class TileResult:
+    """The outcome of rendering one tile."""
+
+    tile: Tile
+    sparse: bool = False
+    md5s: tuple[str, ...] = ()  # of each format, if not sparse
+    uploads: tuple[EncodedTile, ...] = ()  # formats with stale copies
+    half: Image | None = None  # halved tile, if requested and not sparse
+
+
+@dataclass(slots=True)
 class Tile:
-    storage: S3Storage
-    generator: Generator
     level: int
     address: tuple[int, int]
-    key_name: PurePath
-    cur_md5: str | None
-
-    def sync(self) -> PurePath | tuple[int, tuple[int, int]]:
-        """Generate and possibly upload a tile."""
-        tile = self.generator.get_tile(self.level, self.address)
-        if tile.getextrema() == ((255, 255), (255, 255), (255, 255)):  # type: ignore[no-untyped-call]
-            # completely white tile; add to sparse bitmap
-            return (self.level, self.address)
-        buf = BytesIO()
-        tile.save(
-            buf,
-            FORMAT,
-            quality=QUALITY,
-            icc_profile=tile.info.get('icc_profile'),
+    # key and stored MD5 in each format
+    key_names: tuple[PurePath, ...]
+    cur_md5s: tuple[str | None, ...]
+    # stored tile, or absence of one, came from the same inputs
+    unchanged: bool = False
+    # all tiles at the next higher-resolution level are sparse
+    blank: bool = False
+    # return a halved copy for deriving the next lower-resolution level
+    halve: bool = False
+    # assembled from the next higher-resolution level, rather than read
+    source: Image | None = None
+
+    @property
+    def read(self) -> bool:
+        """Whether the tile must be read from the slide to render it."""
+        return not self.unchanged and not self.blank and self.source is None
+
+    def render(
+        self,
+        generator: Generator,
+        times: StageTimes,
+        image: Image | None = None,
+    ) -> TileResult:
+        """Generate a tile and encode it if it differs from the stored
+        copy.  If the tile is read from the slide, image is the result of
+        the read, from Generator.get_tiles()."""
+        if self.unchanged:
+            if None in self.cur_md5s:
+                return TileResult(self, sparse=True)
+            return TileResult(
+                self, md5s=tuple(m for m in self.cur_md5s if m is not None)
+            )
+        if self.blank:
+            return TileResult(self, sparse=True)
+        if self.source is None:
+            tile = image
+        else:
+            # don't send the source back from a process pool worker
+            tile, self.source = self.source, None
+            with times.timed(self.level, 'blank'):
+                if generator.is_blank(tile):
+                    tile = None
+        if tile is None:
+            # background tile; add to sparse bitmap
+            return TileResult(self, sparse=True)
+        md5s = []
+        uploads = []
+        for encoder, key_name, cur_md5 in zip(
+            generator.encoders, self.key_names, self.cur_md5s, strict=True
+        ):
+            with times.timed(self.level, 'encode'):
+                data = encoder.encode(tile)
+            with times.timed(self.level, 'md5'):
+                new_md5 = md5(data).hexdigest()
+            md5s.append(new_md5)
+            if cur_md5 != new_md5:
+                uploads.append(
+                    EncodedTile(key_name, new_md5, data, encoder.content_type)
+                )
+        half = None
+        if self.halve:
+            with times.timed(self.level, 'halve'):
+                half = generator.halve(self.level, self.address, tile)
+        return TileResult(
+            self, md5s=tuple(md5s), uploads=tuple(uploads), half=half
         )
-        new_md5 = md5(buf.getbuffer())
-        if self.cur_md5 != new_md5.hexdigest():
-            self.storage.object(self.key_name).put(
-                Body=buf.getvalue(),
+
+
+class TileScheduler:
+    """Decide which blocks of tiles in a single image are ready to render.
+    Blocks are rectangles of tiles from the same level, shaped by
+    Generator.block_shape().  The highest-resolution level is enumerated
+    in order; a block at any other level is ready once every block it
+    might depend on at the next higher-resolution level has been rendered.
+    Tiles at derived levels are assembled from halved copies of those
+    tiles, which are kept only until every block that uses them is
+    ready."""
+
+    def __init__(
+        self,
+        generator: Generator,
+        key_imagepaths: Sequence[PurePath],
+        key_md5sums: KeyMd5s,
+        prev_sparse_map: SparseMap | None = None,
+    ):
+        """key_imagepaths are the key prefixes of the generator's tile
+        formats.  If prev_sparse_map is specified, the stored tiles were
+        generated from the same inputs, and that was their sparse map."""
+        self.sparse_map = SparseMap(generator)
+        self.stage_times = StageTimes()
+        self._generator = generator
+        self._key_imagepaths = key_imagepaths
+        self._key_md5sums = key_md5sums
+        self._prev_sparse_map = prev_sparse_map
+        self._shapes = [
+            generator.block_shape(level)
+            for level in range(generator.dz.level_count)
+        ]
+        top = generator.dz.level_count - 1
+        cols, rows = generator.dz.level_tiles[top]
+        self._top_blocks = (
+            (top, col, row)
+            for row in self._span(0, rows - 1, rows, self._shapes[top][1])
+            for col in self._span(0, cols - 1, cols, self._shapes[top][0])
+        )
+        self._ready: deque[tuple[int, int, int]] = deque()
+        # unrendered tiles in each submitted block
+        self._unfinished: dict[tuple[int, int, int], int] = {}
+        # unrendered blocks that each waiting block depends on
+        self._waiting: dict[tuple[int, int, int], int] = {}
+        # unsubmitted blocks that depend on each rendered block
+        self._users: dict[tuple[int, int, int], int] = {}
+        self._halves: dict[tuple[int, int, int], Image] = {}
+
+    @staticmethod
+    def _span(first: int, last: int, count: int, size: int) -> range:
+        """Return the indexes of the blocks of the specified size that
+        cover tiles first through last of count."""
+        return range(max(first, 0) // size, min(last, count - 1) // size + 1)
+
+    def _tiles(self, level: int, col: int, row: int) -> tuple[range, range]:
+        """Return the tile columns and rows in a block."""
+        width, height = self._shapes[level]
+        cols, rows = self._generator.dz.level_tiles[level]
+        return (
+            range(col * width, min((col + 1) * width, cols)),
+            range(row * height, min((row + 1) * height, rows)),
+        )
+
+    def _children(
+        self, level: int, col: int, row: int
+    ) -> Iterator[tuple[int, int, int]]:
+        """Yield the blocks at the next higher-resolution level that
+        overlap a block, including overlap."""
+        cols, rows = self._tiles(level, col, row)
+        child_cols, child_rows = self._generator.dz.level_tiles[level + 1]
+        width, height = self._shapes[level + 1]
+        for child_row in self._span(
+            2 * rows[0] - 1, 2 * rows[-1] + 2, child_rows, height
+        ):
+            for child_col in self._span(
+                2 * cols[0] - 1, 2 * cols[-1] + 2, child_cols, width
+            ):
+                yield level + 1, child_col, child_row
+
+    def _parents(
+        self, level: int, col: int, row: int
+    ) -> Iterator[tuple[int, int, int]]:
+        """The inverse of _children()."""
+        cols, rows = self._tiles(level, col, row)
+        parent_cols, parent_rows = self._generator.dz.level_tiles[level - 1]
+        width, height = self._shapes[level - 1]
+        for parent_row in self._span(
+            (rows[0] - 1) // 2, (rows[-1] + 1) // 2, parent_rows, height
+        ):
+            for parent_col in self._span(
+                (cols[0] - 1) // 2, (cols[-1] + 1) // 2, parent_cols, width
+            ):
+                yield level - 1, parent_col, parent_row
+
+    def take(self, count: int) -> list[tuple[Tile, ...]]:
+        """Return up to count blocks that are ready to render, preferring
+        lower-resolution levels so halved tiles can be released."""
+        batches: list[tuple[Tile, ...]] = []
+        while len(batches) < count:
+            block = (
+                self._ready.popleft()
+                if self._ready
+                else next(self._top_blocks, None)
+            )
+            if block is None:
+                break
+            batches.append(self._block(*block))
+        return batches
+
+    def finish(self, result: TileResult) -> None:
+        """Record the result of rendering a tile."""
+        level = result.tile.level
+        col, row = result.tile.address
+        if result.sparse:
+            self.sparse_map.set_bit(level, (col, row))
+        if result.half is not None:
+            self._halves[level, col, row] = result.half
+        width, height = self._shapes[level]
+        block = (level, col // width, row // height)
+        self._unfinished[block] -= 1
+        if self._unfinished[block]:
+            return
+        del self._unfinished[block]
+        if level == 0:
+            return
+        parents = list(self._parents(*block))
+        self._users[block] = len(parents)
+        for parent in parents:
+            if parent not in self._waiting:
+                self._waiting[parent] = sum(1 for _ in self._children(*parent))
+            self._waiting[parent] -= 1
+            if not self._waiting[parent]:
+                del self._waiting[parent]
+                self._ready.append(parent)
+
+    def _block(self, level: int, col: int, row: int) -> tuple[Tile, ...]:
+        """Create the tiles in a block, then release halved tiles that are
+        no longer needed."""
+        cols, rows = self._tiles(level, col, row)
+        tiles = tuple(
+            self._tile(level, tile_col, tile_row)
+            for tile_row in rows
+            for tile_col in cols
+        )
+        self._unfinished[level, col, row] = len(tiles)
+        if level + 1 < len(self._shapes):
+            for child in self._children(level, col, row):
+                self._users[child] -= 1
+                if self._users[child]:
+                    continue
+                del self._users[child]
+                child_cols, child_rows = self._tiles(*child)
+                for tile_row in child_rows:
+                    for tile_col in child_cols:
+                        self._halves.pop((level + 1, tile_col, tile_row), None)
+        return tiles
+
+    def _tile(self, level: int, col: int, row: int) -> Tile:
+        key_names = tuple(
+            key_imagepath / str(level) / f'{col}_{row}.{encoder.format}'
+            for key_imagepath, encoder in zip(
+                self._key_imagepaths, self._generator.encoders, strict=True
+            )
+        )
+        cur_md5s = tuple(self._key_md5sums.get(k) for k in key_names)
+        unchanged = self._prev_sparse_map is not None and (
+            None not in cur_md5s
+            or self._prev_sparse_map.get_bit(level, (col, row))
+        )
+        blank = not unchanged and self.sparse_map.children_sparse(
+            level, (col, row)
+        )
+        derived = self._generator.derived
+        return Tile(
+            level,
+            (col, row),
+            key_names,
+            cur_md5s,
+            unchanged,
+            blank,
+            halve=level > 0 and derived[level - 1],
+            source=(
+                self._compose(level, col, row)
+                if derived[level] and not unchanged and not blank
+                else None
+            ),
+        )
+
+    def _compose(self, level: int, col: int, row: int) -> Image | None:
+        """Assemble a tile at a derived level, or return None if a tile it
+        depends on was rendered without a halved copy."""
+        child_cols, child_rows = self._generator.dz.level_tiles[level + 1]
+        halves = {}
+        for child_row in self._span(2 * row - 1, 2 * row + 2, child_rows, 1):
+            for child_col in self._span(
+                2 * col - 1, 2 * col + 2, child_cols, 1
+            ):
+                half = self._halves.get((level + 1, child_col, child_row))
+                if half is not None:
+                    halves[child_col, child_row] = half
+                elif not self.sparse_map.get_bit(
+                    level + 1, (child_col, child_row)
+                ):
+                    return None
+        with self.stage_times.timed(level, 'compose'):
+            return self._generator.compose(level, (col, row), halves)
+
+
+@dataclass(slots=True)
+class RenderedBatch:
+    """The outcome of rendering a block of tiles."""
+
+    results: list[TileResult]
+    stage_times: StageTimes
+    # estimated OpenSlide cache hits and misses per DZ level, since the
+    # previous batch from the same generator
+    cache_counts: dict[int, tuple[int, int]]
+
+
+def render_tiles(
+    generator: Generator, tiles: tuple[Tile, ...]
+) -> RenderedBatch:
+    """Render a block of tiles from the same level, skipping any that are
+    blank at low resolution."""
+    times = StageTimes()
+    level = tiles[0].level
+    blank = generator.find_blank_tiles(
+        level, [tile.address for tile in tiles if tile.read], times
+    )
+    images = generator.get_tiles(
+        level,
+        [
+            tile.address
+            for tile in tiles
+            if tile.read and tile.address not in blank
+        ],
+        times,
+    )
+    results = []
+    for tile in tiles:
+        if tile.address in blank:
+            results.append(TileResult(tile, sparse=True))
+        elif tile.read:
+            results.append(tile.render(generator, times, next(images)))
+        else:
+            results.append(tile.render(generator, times))
+    return RenderedBatch(
+        results,
+        times,
+        generator.cache.take_counts() if generator.cache is not None else {},
+    )
+
+
+# Slide state in a process pool worker
+_worker_slide: OpenSlide | None = None
+_worker_slide_path: Path | None = None
+_worker_cache_size = 0
+_worker_color_lut = False
+_worker_formats: Sequence[str] = ()
+_worker_generators: dict[str | None, Generator] = {}
+
+
+def _init_worker(color_lut: bool, formats: Sequence[str]) -> None:
+    """Configure a process pool worker."""
+    global _worker_color_lut, _worker_formats
+    _worker_color_lut = color_lut
+    _worker_formats = formats
+
+
+def _render_tiles(
+    slide_path: Path,
+    cache_size: int,
+    associated: str | None,
+    tiles: tuple[Tile, ...],
+) -> RenderedBatch:
+    """Render a batch of tiles in a process pool worker, first opening the
+    slide if the worker last rendered a different one."""
+    global _worker_slide, _worker_slide_path, _worker_cache_size
+    if slide_path != _worker_slide_path:
+        if _worker_slide is not None:
+            _worker_slide.close()
+        _worker_slide = OpenSlide(slide_path)
+        _worker_slide.set_cache(OpenSlideCache(cache_size))
+        _worker_slide_path = slide_path
+        _worker_cache_size = cache_size
+        _worker_generators.clear()
+    assert _worker_slide is not None
+    generator = _worker_generators.get(associated)
+    if generator is None:
+        generator = _worker_generators[associated] = (
+            Generator(
+                _worker_slide,
+                _worker_cache_size,
+                _worker_color_lut,
+                _worker_formats,
+            )
+            if associated is None
+            else Generator(
+                ImageSlide(_worker_slide.associated_images[associated]),
+                color_lut=_worker_color_lut,
+                formats=_worker_formats,
+            )
+        )
+    return render_tiles(generator, tiles)
+
+
+@dataclass
+class TileOptions:
+    """Options for the tile subcommand."""
+
+    workers: int
+    upload_workers: int
+    processes: bool = False
+    async_upload: bool = False
+    download_dir: Path | None = None
+    # tile batches in flight; default COMPUTE_QUEUE_DEPTH per worker
+    in_flight: int | None = None
+    # convert colors with a lookup table rather than LittleCMS
+    color_lut: bool = False
+
+
+def max_cache_size() -> int:
+    """Return the most OpenSlide cache that all compute workers together
+    should use."""
+    try:
+        memory = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (OSError, ValueError):
+        return MAX_CACHE_SIZE
+    return min(int(memory * MAX_CACHE_FRACTION), MAX_CACHE_SIZE)
+
+
+class TilePool:
+    """A two-stage pipeline that renders and uploads the tiles of one slide
+    at a time.
+
+    Tiles are rendered in batches by a pool of threads, which share the
+    slide handle, or processes, which each open their own.  Changed tiles
+    are then passed to a separate uploader.  Each stage has a bounded
+    queue: when the upload queue is full, no further batches are submitted
+    for rendering.  The workers and the uploader's connections are kept
+    when open() moves the pool to another slide."""
+
+    def __init__(
+        self,
+        storage: S3Storage,
+        options: TileOptions,
+        formats: Sequence[str] = (FORMAT,),
+    ) -> None:
+        self.storage = storage
+        self.mode = 'process' if options.processes else 'thread'
+        self._workers = options.workers
+        self._color_lut = options.color_lut
+        self._formats = formats
+        self._slide: OpenSlide | None = None
+        self._slide_path: Path | None = None
+        self.cache_size = 0
+        self._generators: dict[str | None, Generator] = {}
+        self._exec: Executor
+        if options.processes:
+            self._exec = ProcessPoolExecutor(
+                options.workers,
+                initializer=_init_worker,
+                initargs=(options.color_lut, formats),
+            )
+        else:
+            self._exec = ThreadPoolExecutor(options.workers)
+        # associated image -> DZ level -> [hits, misses]
+        self.cache_counts: dict[str | None, dict[int, list[int]]] = {}
+        self.stage_times: dict[str | None, StageTimes] = {}
+        self._max_batches = (
+            options.in_flight or COMPUTE_QUEUE_DEPTH * options.workers
+        )
+        self._uploader: Uploader = (
+            AsyncUploader(storage, options.upload_workers)
+            if options.async_upload
+            else ThreadUploader(storage, options.upload_workers)
+        )
+        self._upload_slots = BoundedSemaphore(
+            UPLOAD_QUEUE_DEPTH * options.upload_workers
+        )
+        self._uploads: set[Future[float]] = set()
+        self._upload_error: BaseException | None = None
+        self._lock = Lock()
+
+    def open(self, slide: OpenSlide, slide_path: Path) -> None:
+        """Start tiling a slide, after any previous slide has been synced
+        and drained, and reset the statistics."""
+        self._slide = slide
+        self._slide_path = slide_path
+        self._generators.clear()
+        self.cache_counts.clear()
+        self.stage_times.clear()
+        # associated images are decoded up front and don't use the cache
+        worker_cache_size = min(
+            Generator(slide).worker_cache_size(),
+            max_cache_size() // self._workers,
+        )
+        if self.mode == 'process':
+            self.cache_size = worker_cache_size
+        else:
+            # one cache, shared by all threads
+            self.cache_size = self._workers * worker_cache_size
+            slide.set_cache(OpenSlideCache(self.cache_size))
+            self._generators[None] = Generator(
+                slide, self.cache_size, self._color_lut, self._formats
+            )
+
+    def generator(self, associated: str | None) -> Generator:
+        """Return a generator for the slide or an associated image."""
+        assert self._slide is not None
+        generator = self._generators.get(associated)
+        if generator is None:
+            generator = self._generators[associated] = Generator(
+                self._slide
+                if associated is None
+                else ImageSlide(self._slide.associated_images[associated]),
+                color_lut=self._color_lut,
+                formats=self._formats,
+            )
+        return generator
+
+    def sync(
+        self,
+        schedulers: Mapping[str | None, TileScheduler],
+        upload: bool = True,
+    ) -> Iterator[tuple[str | None, TileResult]]:
+        """Render the tiles of several images, keyed by associated image
+        name, in the order chosen by their schedulers and, if upload is
+        true, upload the changed ones, yielding results as they are
+        rendered.  Blocks are taken from the first scheduler with any
+        ready, so later images fill the pool while earlier ones wait for
+        their dependencies.  Uploads may still be in progress on return;
+        call drain() to wait for them."""
+        pending: dict[Future[RenderedBatch], str | None] = {}
+        while True:
+            for associated, scheduler in schedulers.items():
+                for batch in scheduler.take(self._max_batches - len(pending)):
+                    pending[self._submit(associated, batch)] = associated
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                associated = pending.pop(future)
+                scheduler = schedulers[associated]
+                rendered = future.result()
+                with self._lock:
+                    self._stage_times(associated).update(rendered.stage_times)
+                counts = self.cache_counts.setdefault(associated, {})
+                for level, (hits, misses) in rendered.cache_counts.items():
+                    level_counts = counts.setdefault(level, [0, 0])
+                    level_counts[0] += hits
+                    level_counts[1] += misses
+                for result in rendered.results:
+                    for encoded in result.uploads if upload else ():
+                        self._upload(associated, result.tile.level, encoded)
+                    scheduler.finish(result)
+                    yield associated, result
+        with self._lock:
+            for associated, scheduler in schedulers.items():
+                self._stage_times(associated).update(scheduler.stage_times)
+
+    def _stage_times(self, associated: str | None) -> StageTimes:
+        return self.stage_times.setdefault(associated, StageTimes())
+
+    def _submit(
+        self, associated: str | None, tiles: tuple[Tile, ...]
+    ) -> Future[RenderedBatch]:
+        if self.mode == 'process':
+            assert self._slide_path is not None
+            return self._exec.submit(
+                _render_tiles,
+                self._slide_path,
+                self.cache_size,
+                associated,
+                tiles,
+            )
+        return self._exec.submit(
+            render_tiles, self.generator(associated), tiles
+        )
+
+    def _upload(
+        self, associated: str | None, level: int, encoded: EncodedTile
+    ) -> None:
+        # blocks while the upload queue is full
+        self._upload_slots.acquire()
+        if self._upload_error is not None:
+            self._upload_slots.release()
+            raise self._upload_error
+        future = self._uploader.submit(encoded)
+        with self._lock:
+            self._uploads.add(future)
+        future.add_done_callback(partial(self._upload_done, associated, level))
+
+    def _upload_done(
+        self, associated: str | None, level: int, future: Future[float]
+    ) -> None:
+        with self._lock:
+            self._uploads.discard(future)
+            if not future.cancelled() and future.exception() is None:
+                self._stage_times(associated).add(
+                    level, 'put', future.result()
+                )
+        if not future.cancelled() and future.exception() is not None:
+            self._upload_error = future.exception()
+        self._upload_slots.release()
+
+    def drain(self) -> None:
+        """Wait for pending uploads and raise the first upload error."""
+        with self._lock:
+            uploads = list(self._uploads)
+        wait(uploads)
+        if self._upload_error is not None:
+            raise self._upload_error
+
+    def shutdown(self, cancel_futures: bool = False) -> None:
+        self._exec.shutdown(cancel_futures=cancel_futures)
+        self._uploader.shutdown(cancel_futures=cancel_futures)
+
+
+class PackWriter:
+    """Append tiles in one format to a single object, streamed to S3 as a
+    multipart upload, and record the byte range of each in an index."""
+
+    def __init__(
+        self,
+        storage: S3Storage,
+        key_name: PurePath,
+        count: int,
+        exec: ThreadPoolExecutor,
+    ) -> None:
+        self.key_name = key_name
+        self.index_key_name = key_name.with_suffix('.index')
+        # of each tile in the image, in level and then row-major order
+        self.offsets = np.zeros(count, dtype='<u8')
+        self.lengths = np.zeros(count, dtype='<u4')
+        self._storage = storage
+        self._exec = exec
+        self._buf = bytearray()
+        self._size = 0
+        self._md5 = md5()
+        self._upload: MultipartUpload | None = None
+        self._parts: list[Future[CompletedPartTypeDef]] = []
+
+    def append(self, index: int, data: bytes) -> None:
+        self.offsets[index] = self._size
+        self.lengths[index] = len(data)
+        self._buf += data
+        self._size += len(data)
+        self._md5.update(data)
+        if len(self._buf) >= PACK_PART_SIZE:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._upload is None:
+            self._upload = self._storage.object(
+                self.key_name
+            ).initiate_multipart_upload(
                 CacheControl=CACHE_CONTROL_CACHE,
-                ContentMD5=base64.b64encode(new_md5.digest()).decode(),
-                ContentType=f'image/{FORMAT}',
+                ContentType='application/octet-stream',
+            )
+        # bound the parts held in memory
+        pending = [f for f in self._parts if not f.done()]
+        if len(pending) >= 2 * PACK_UPLOAD_WORKERS:
+            wait(pending, return_when=FIRST_COMPLETED)
+        self._parts.append(
+            self._exec.submit(
+                self._upload_part,
+                self._upload,
+                len(self._parts) + 1,
+                bytes(self._buf),
             )
-        return self.key_name
+        )
+        self._buf.clear()
 
-    @classmethod
-    def enumerate(
-        cls,
+    @staticmethod
+    def _upload_part(
+        upload: MultipartUpload, number: int, data: bytes
+    ) -> CompletedPartTypeDef:
+        resp = upload.Part(number).upload(
+            Body=data,
+            ContentMD5=base64.b64encode(md5(data).digest()).decode(),
+        )
+        return {'ETag': resp['ETag'], 'PartNumber': number}
+
+    def close(self) -> str:
+        """Finish the upload, store the index, and return the MD5 of the
+        packed object."""
+        if self._upload is None:
+            # small enough for one request
+            self._storage.object(self.key_name).put(
+                Body=bytes(self._buf),
+                CacheControl=CACHE_CONTROL_CACHE,
+                ContentMD5=base64.b64encode(self._md5.digest()).decode(),
+                ContentType='application/octet-stream',
+            )
+        else:
+            if self._buf:
+                self._flush()
+            self._upload.complete(
+                MultipartUpload={'Parts': [f.result() for f in self._parts]}
+            )
+            self._upload = None
+        self._storage.object(self.index_key_name).put(
+            Body=gzip.compress(
+                self.offsets.tobytes() + self.lengths.tobytes()
+            ),
+            CacheControl=CACHE_CONTROL_CACHE,
+            ContentEncoding='gzip',
+            ContentType='application/octet-stream',
+        )
+        return self._md5.hexdigest()
+
+    def abort(self) -> None:
+        for future in self._parts:
+            future.cancel()
+        if self._upload is not None:
+            wait(self._parts)
+            self._upload.abort()
+
+
+class TilePacker:
+    """Pack the tiles of one image into one object per format, rather than
+    one object per tile.  Tiles are appended in the order they are
+    rendered, and located with an index object holding the offset
+    (uint64) and then the length (uint32) of every tile in the image, in
+    level and then row-major order.  Sparse tiles have length 0."""
+
+    def __init__(
+        self,
         storage: S3Storage,
         generator: Generator,
-        key_imagepath: PurePath,
+        key_imagepaths: Sequence[PurePath],
+        pack: str,
+    ) -> None:
+        self._level_tiles = generator.dz.level_tiles
+        self._level_bases = [0]
+        for cols, rows in self._level_tiles:
+            self._level_bases.append(self._level_bases[-1] + cols * rows)
+        self._exec = ThreadPoolExecutor(PACK_UPLOAD_WORKERS)
+        self._writers = [
+            PackWriter(
+                storage,
+                key_imagepath / f'{pack}.pack',
+                self._level_bases[-1],
+                self._exec,
+            )
+            for key_imagepath in key_imagepaths
+        ]
+
+    def add(self, result: TileResult) -> None:
+        if result.sparse:
+            return
+        level = result.tile.level
+        col, row = result.tile.address
+        index = (
+            self._level_bases[level] + row * self._level_tiles[level][0] + col
+        )
+        for writer, encoded in zip(self._writers, result.uploads, strict=True):
+            writer.append(index, encoded.data)
+
+    def close(self) -> KeyMd5s:
+        """Finish the packed objects and return the MD5s of the keys
+        written."""
+        key_md5sums: KeyMd5s = {}
+        try:
+            for writer in self._writers:
+                key_md5sums[writer.key_name] = writer.close()
+                key_md5sums[writer.index_key_name] = md5(
+                    writer.offsets.tobytes() + writer.lengths.tobytes()
+                ).hexdigest()
+        finally:
+            self._exec.shutdown()
+        return key_md5sums
+
+    def abort(self) -> None:
+        for writer in self._writers:
+            writer.abort()
+        self._exec.shutdown(cancel_futures=True)
+
+
+class ImageSync:
+    """Sync the tiles and metadata of a single image.  Tiles are rendered
+    by sync_images(), which may interleave them with tiles of other images
+    from the same slide; results are passed to add() in whatever order
+    they finish, and finish() assembles the image metadata once the last
+    has been added."""
+
+    def __init__(
+        self,
+        pool: TilePool,
+        associated: str | None,
+        key_basepath: PurePath,
         key_md5sums: KeyMd5s,
-    ) -> Iterator[Self]:
-        """Enumerate tiles in a single image."""
-        for level in range(generator.dz.level_count):
-            key_levelpath = key_imagepath / str(level)
-            cols, rows = generator.dz.level_tiles[level]
-            for row in range(rows):
-                for col in range(cols):
-                    key_name = key_levelpath / f'{col}_{row}.{FORMAT}'
-                    yield cls(
-                        storage,
-                        generator,
-                        level,
-                        (col, row),
-                        key_name,
-                        key_md5sums.get(key_name),
+        key_manifest: KeyMd5s,
+        mpp: float | None = None,
+        prev_info: ImageInfo | None = None,
+        pack: str | None = None,
+        pruner: KeyPruner | None = None,
+    ) -> None:
+        """Delete valid tiles from key_md5sums and add them to
+        key_manifest.  If prev_info is specified, the stored tiles were
+        generated from the same inputs and can be reused.  If pack is
+        specified, store the tiles in packed objects with that name
+        rather than one object per tile.  If pruner is specified, stale
+        keys are removed from key_md5sums and deleted as soon as they're
+        known: those of each rendered tile, then any others left in a
+        level's directory once the level is complete."""
+        self.associated = associated
+        self.slug = slugify(associated) if associated else VIEWER_SLIDE_NAME
+        self.generator = pool.generator(associated)
+        self._pool = pool
+        self._key_md5sums = key_md5sums
+        self._key_manifest = key_manifest
+        self._mpp = mpp
+        self._pack = pack
+        self._pruner = pruner
+        self.packed = pack is not None
+        # the default format keeps the unprefixed path
+        self._key_imagepaths = [
+            key_basepath
+            / (
+                f'{self.slug}_files'
+                if encoder.format == FORMAT
+                else f'{self.slug}_{encoder.format}_files'
+            )
+            for encoder in self.generator.encoders
+        ]
+
+        # Reuse packed tiles.  A packed object can't be partially updated,
+        # so this is all or nothing.
+        self.reused: ImageInfo | None = None
+        if pack is not None and prev_info is not None:
+            pack_keys = {
+                key_imagepath / f'{pack}{suffix}'
+                for key_imagepath in self._key_imagepaths
+                for suffix in ('.pack', '.index')
+            }
+            if pack_keys <= key_md5sums.keys():
+                for key_name in pack_keys:
+                    key_manifest[key_name] = key_md5sums.pop(key_name)
+                self.reused = prev_info
+            prev_info = None
+
+        # Find old keys in each level's directory, and prune them once the
+        # level is complete.  Levels that no longer exist are complete.
+        self._level_keys: dict[int, list[PurePath]] = {}
+        self._level_remaining = [
+            cols * rows if self.reused is None else 0
+            for cols, rows in self.generator.dz.level_tiles
+        ]
+        if pruner is not None:
+            imagepaths = set(self._key_imagepaths)
+            for key_name in key_md5sums:
+                if (
+                    key_name.parent.parent in imagepaths
+                    and key_name.parent.name.isdigit()
+                ):
+                    self._level_keys.setdefault(
+                        int(key_name.parent.name), []
+                    ).append(key_name)
+            for level in list(self._level_keys):
+                if level >= len(self._level_remaining) or (
+                    not self._level_remaining[level]
+                ):
+                    self._prune_level(level)
+
+        self.scheduler = TileScheduler(
+            self.generator,
+            self._key_imagepaths,
+            key_md5sums if pack is None else {},
+            (
+                SparseMap.load(self.generator, prev_info['sparse'])
+                if prev_info is not None
+                else None
+            ),
+        )
+        self._packer = (
+            TilePacker(
+                pool.storage, self.generator, self._key_imagepaths, pack
+            )
+            if pack is not None and self.reused is None
+            else None
+        )
+
+    def add(self, result: TileResult) -> None:
+        """Record a rendered tile."""
+        if self._packer is not None:
+            self._packer.add(result)
+        elif not result.sparse:
+            for key_name, md5sum in zip(
+                result.tile.key_names, result.md5s, strict=True
+            ):
+                self._key_md5sums.pop(key_name, None)
+                self._key_manifest[key_name] = md5sum
+        if self._pruner is not None and (
+            result.sparse or self._packer is not None
+        ):
+            # nothing else will be stored at these keys in this run
+            stale = [
+                key_name
+                for key_name in result.tile.key_names
+                if key_name in self._key_md5sums
+            ]
+            for key_name in stale:
+                del self._key_md5sums[key_name]
+            self._pruner.add(stale)
+        level = result.tile.level
+        self._level_remaining[level] -= 1
+        if self._pruner is not None and not self._level_remaining[level]:
+            self._prune_level(level)
+
+    def _prune_level(self, level: int) -> None:
+        """Prune the old keys left in a level's directories."""
+        assert self._pruner is not None
+        stale = [
+            key_name
+            for key_name in self._level_keys.pop(level, [])
+            if key_name in self._key_md5sums
+        ]
+        for key_name in stale:
+            del self._key_md5sums[key_name]
+        self._pruner.add(stale)
+
+    def finish(self) -> ImageInfo:
+        """Finish storing tiles, after every tile has been added and the
+        pool drained, and return the image metadata."""
+        if self.reused is not None:
+            return self.reused
+        if self._packer is not None:
+            for key_name, md5sum in self._packer.close().items():
+                self._key_md5sums.pop(key_name, None)
+                self._key_manifest[key_name] = md5sum
+
+        # Format tile sources
+        generator = self.generator
+        sources: list[DzSource] = [
+            {
+                'Image': {
+                    'xmlns': 'http://schemas.microsoft.com/deepzoom/2008',
+                    'Url': urljoin(
+                        self._pool.storage.base_url, key_imagepath.as_posix()
                     )
+                    + '/',
+                    'Format': encoder.format,
+                    'TileSize': TILE_SIZE,
+                    'Overlap': OVERLAP,
+                    'Size': {
+                        'Width': generator.dz.level_dimensions[-1][0],
+                        'Height': generator.dz.level_dimensions[-1][1],
+                    },
+                }
+            }
+            for key_imagepath, encoder in zip(
+                self._key_imagepaths, generator.encoders, strict=True
+            )
+        ]
+
+        # Return metadata
+        info: ImageInfo = {
+            'name': self.associated,
+            'mpp': self._mpp,
+            'source': sources[0],
+            'sources': sources,
+            'sparse': self.scheduler.sparse_map.save(),
+        }
+        if self._pack is not None:
+            info['pack'] = self._pack
+        return info
+
+    def abort(self) -> None:
+        if self._packer is not None:
+            self._packer.abort()
+
+
+def sync_images(
+    pool: TilePool, slide_relpath: PurePath, images: Sequence[ImageSync]
+) -> list[ImageInfo]:
+    """Generate and upload tiles, and generate metadata, for several images
+    from one slide.  Tiles of all the images share the pool, so it is kept
+    busy while an image waits for its last few tiles; images earlier in
+    the list are preferred."""
+
+    rendering = [image for image in images if image.reused is None]
+    for image in images:
+        if image.reused is not None:
+            print(f'Reused packed tiles for {slide_relpath} {image.slug}')
+    count = 0
+    total = sum(image.generator.dz.tile_count for image in rendering)
+
+    def progress() -> None:
+        print(f'Tiling {slide_relpath}: {count}/{total} tiles\r', end='')
+        sys.stdout.flush()
+
+    # Sync tiles
+    progress()
+    start = time.monotonic()
+    by_name = {image.associated: image for image in rendering}
+    try:
+        for associated, result in pool.sync(
+            {image.associated: image.scheduler for image in rendering},
+            upload=not any(image.packed for image in rendering),
+        ):
+            by_name[associated].add(result)
+            count += 1
+            if count % 100 == 0:
+                progress()
+        pool.drain()
+        infos = [image.finish() for image in images]
+    except BaseException:
+        for image in rendering:
+            image.abort()
+        raise
+    progress()
+    print()
+    elapsed = time.monotonic() - start
+    print(
+        f'Tiled {slide_relpath} in {elapsed:.1f} s: '
+        f'{count / elapsed:.1f} tiles/s with {pool.mode} pool'
+    )
+    for image in rendering:
+        cache_counts = pool.cache_counts.pop(image.associated, {})
+        if cache_counts:
+            print(
+                f'Estimated hit rate of {pool.cache_size >> 20} MiB '
+                f'{pool.mode} cache for {image.slug}: '
+                + ', '.join(
+                    f'level {level} {100 * hits / (hits + misses):.0f}% '
+                    f'of {hits + misses}'
+                    for level, (hits, misses) in sorted(
+                        cache_counts.items(), reverse=True
+                    )
+                    if hits + misses
+                )
+            )
+    return infos
 
 
 def sync_image(
-    exec: ThreadPoolExecutor,
-    storage: S3Storage,
-    generator: Generator,
+    pool: TilePool,
     slide_relpath: PurePath,
     associated: str | None,
     key_basepath: PurePath,
     key_md5sums: KeyMd5s,
+    key_manifest: KeyMd5s,
     mpp: float | None = None,
+    prev_info: ImageInfo | None = None,
+    pack: str | None = None,
 ) -> ImageInfo:
     """Generate and upload tiles, and generate metadata, for a single image.
-    Delete valid tiles from key_md5sums."""
+    Arguments are as for ImageSync."""
+    image = ImageSync(
+        pool,
+        associated,
+        key_basepath,
+        key_md5sums,
+        key_manifest,
+        mpp,
+        prev_info,
+        pack,
+    )
+    return sync_images(pool, slide_relpath, [image])[0]
 
-    count = 0
-    total = generator.dz.tile_count
-    associated_slug = slugify(associated) if associated else VIEWER_SLIDE_NAME
-    key_imagepath = key_basepath / f'{associated_slug}_files'
 
-    def progress() -> None:
-        print(
-            f'Tiling {slide_relpath} {associated_slug}: '
-            f'{count}/{total} tiles\r',
-            end='',
-        )
-        sys.stdout.flush()
+@contextmanager
+def timed(timings: dict[str, float], stage: str) -> Iterator[None]:
+    """Add the time spent in the context to timings[stage]."""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0) + time.monotonic() - start
 
-    # Sync tiles
-    progress()
-    sparse_map = SparseMap(generator)
-    for future in as_completed(
-        exec.submit(Tile.sync, tile)
-        for tile in Tile.enumerate(
-            storage, generator, key_imagepath, key_md5sums
-        )
-    ):
-        result = future.result()
-        if isinstance(result, PurePath):
-            key_md5sums.pop(result, None)
+
+def list_keys(
+    storage: S3Storage,
+    key_basepath: PurePath,
+    stamp: str | None,
+    timings: dict[str, float],
+) -> tuple[KeyMd5s, str | None]:
+    """Return the MD5s of the existing keys under key_basepath, and the
+    tiling fingerprint of those keys if known.  If the slide's key manifest
+    was written with the specified stamp, read them from there; otherwise,
+    list the bucket."""
+    key_md5sums = {}
+    with timed(timings, 'list'):
+        if stamp is not None:
+            try:
+                resp = storage.object(key_basepath / SLIDE_MANIFEST_NAME).get()
+                with gzip.open(resp['Body']) as body:
+                    manifest: KeyManifest = json.load(body)
+                if manifest['stamp'] == stamp:
+                    return {
+                        key_basepath / key: md5sum
+                        for key, md5sum in manifest['keys'].items()
+                    }, manifest.get('fingerprint')
+            except storage.NoSuchKey:
+                pass
+        for obj in storage.bucket.objects.filter(
+            Prefix=key_basepath.as_posix() + '/'
+        ):
+            key_md5sums[PurePath(obj.key)] = obj.e_tag.strip('"')
+    return key_md5sums, None
+
+
+class KeyPruner:
+    """Delete keys in the background.  Keys are deleted in batches of
+    PRUNE_BATCH_SIZE, with up to PRUNE_WORKERS requests in flight, as soon
+    as each batch fills.  Keys that a batch fails to delete are retried
+    one at a time.  After close(), elapsed is the time during which any
+    batch was being deleted."""
+
+    def __init__(self, storage: S3Storage) -> None:
+        self.count = 0
+        self.elapsed = 0.0
+        self._storage = storage
+        self._exec = ThreadPoolExecutor(PRUNE_WORKERS)
+        self._futures: list[Future[list[PurePath]]] = []
+        self._batch: list[PurePath] = []
+        self._spans: list[tuple[float, float]] = []
+
+    def add(self, keys: Iterable[PurePath]) -> None:
+        for key in keys:
+            self._batch.append(key)
+            if len(self._batch) == PRUNE_BATCH_SIZE:
+                self._submit()
+
+    def _submit(self) -> None:
+        self._futures.append(self._exec.submit(self._delete, self._batch))
+        self.count += len(self._batch)
+        self._batch = []
+
+    def _delete(self, keys: list[PurePath]) -> list[PurePath]:
+        """Delete a batch of keys and return the ones that failed."""
+        start = time.monotonic()
+        try:
+            result = self._storage.bucket.delete_objects(
+                Delete={
+                    'Objects': [{'Key': key.as_posix()} for key in keys],
+                    'Quiet': True,
+                },
+            )
+            retry = [
+                PurePath(error['Key']) for error in result.get('Errors', [])
+            ]
+        except (BotoCoreError, ClientError):
+            retry = keys
+        failed = []
+        for key in retry:
+            try:
+                self._storage.object(key).delete()
+            except (BotoCoreError, ClientError):
+                failed.append(key)
+        self._spans.append((start, time.monotonic()))
+        return failed
+
+    def close(self) -> None:
+        """Delete the remaining keys and wait for every batch."""
+        if self._batch:
+            self._submit()
+        self._exec.shutdown()
+        failed = [key for future in self._futures for key in future.result()]
+        end = 0.0
+        for span_start, span_end in sorted(self._spans):
+            self.elapsed += max(span_end - max(span_start, end), 0)
+            end = max(end, span_end)
+        if failed:
+            raise OSError(f'Failed to delete {len(failed)} keys')
+
+    def abort(self) -> None:
+        self._exec.shutdown(cancel_futures=True)
+
+
+def tiling_fingerprint(
+    slide_info: TestDataSlide, formats: Sequence[str], pack: bool = False
+) -> str:
+    """Return a hash of the inputs that determine the contents of a slide's
+    tiles in the specified formats and layout, other than the tile
+    address."""
+    inputs = [
+        slide_info['sha256'],
+        TILING_VERSION,
+        openslide.__library_version__,
+        openslide.__version__,
+        PIL.__version__,
+        sha256(SRGB_PROFILE_BYTES).hexdigest(),
+        TILE_SIZE,
+        OVERLAP,
+        LIMIT_BOUNDS,
+        DERIVE_LEVELS,
+        {format: TILE_FORMATS[format] for format in sorted(formats)},
+        JPEG_EFFORT,
+        TILE_BLOCK,
+        BLANK_TOLERANCE,
+        BLANK_FRACTION,
+        BLANK_CHECK_SIZE,
+    ]
+    if pack:
+        inputs.append('packed')
+    return sha256(json.dumps(inputs).encode()).hexdigest()[:16]
+
+
+def _fetch_range(
+    session: requests.Session,
+    url: str,
+    fd: int,
+    start: int,
+    end: int,
+    ranged: bool = True,
+) -> None:
+    """Download bytes [start, end) of url into fd.  After a failure, retry
+    from where we left off if the server supports range requests."""
+    for attempt in range(FETCH_ATTEMPTS):
+        if ranged:
+            headers = {'Range': f'bytes={start}-{end - 1}'}
         else:
-            sparse_map.set_bit(*result)
-        count += 1
-        if count % 100 == 0:
-            progress()
-    progress()
-    print()
+            headers = {}
+            start = 0
+        try:
+            r = session.get(url, headers=headers, stream=True)
+            r.raise_for_status()
+            if ranged and r.status_code != 206:
+                raise OSError(f'Server ignored range request for {url}')
+            for buf in r.iter_content(1 << 20):
+                os.pwrite(fd, buf, start)
+                start += len(buf)
+            if start != end:
+                raise OSError(f'Short read fetching {url}')
+            return
+        except OSError:
+            if attempt == FETCH_ATTEMPTS - 1:
+                raise
 
-    # Format tile source
-    source: DzSource = {
-        'Image': {
-            'xmlns': 'http://schemas.microsoft.com/deepzoom/2008',
-            'Url': urljoin(storage.base_url, key_imagepath.as_posix()) + '/',
-            'Format': FORMAT,
-            'TileSize': TILE_SIZE,
-            'Overlap': OVERLAP,
-            'Size': {
-                'Width': generator.dz.level_dimensions[-1][0],
-                'Height': generator.dz.level_dimensions[-1][1],
-            },
+
+def fetch_slide(
+    slide_relpath: PurePath, slide_info: TestDataSlide, path: Path
+) -> None:
+    """Download a slide to path and verify its hash.  Download chunks in
+    parallel with range requests, hashing each as soon as the chunks before
+    it have arrived.  Resume a partial download left in the same directory
+    by an earlier run, and skip the download if path already exists with
+    the expected contents."""
+
+    url = urljoin(DOWNLOAD_BASE_URL, slide_relpath.as_posix())
+    size = slide_info['size']
+    partial_path = path.with_name(path.name + '.partial')
+    state_path = path.with_name(path.name + '.chunks')
+    temp_state_path = path.with_name(path.name + '.chunks.tmp')
+
+    # Check for an existing copy
+    if path.exists():
+        hash = sha256()
+        with path.open('rb') as fh:
+            while buf := fh.read(FETCH_CHUNK_SIZE):
+                hash.update(buf)
+        if hash.hexdigest() == slide_info['sha256']:
+            return
+        path.unlink()
+
+    with requests.Session() as session:
+        session.mount(url, HTTPAdapter(pool_maxsize=FETCH_WORKERS))
+
+        # Fall back to a single request if the server can't do ranges
+        r = session.head(url, allow_redirects=True)
+        r.raise_for_status()
+        if int(r.headers['Content-Length']) != size:
+            raise OSError(f'Size mismatch fetching {slide_relpath}')
+        ranged = r.headers.get('Accept-Ranges') == 'bytes'
+        chunk_size = FETCH_CHUNK_SIZE if ranged else max(size, 1)
+        chunks = -(size // -chunk_size)  # ceil division
+
+        # Load resume state
+        state: FetchState = {
+            'sha256': slide_info['sha256'],
+            'chunk_size': chunk_size,
+            'done': [],
         }
-    }
+        try:
+            prev_state: FetchState = json.loads(state_path.read_text())
+            if (
+                partial_path.exists()
+                and prev_state['sha256'] == state['sha256']
+                and prev_state['chunk_size'] == chunk_size
+            ):
+                state = prev_state
+                print(f'Resuming {len(state["done"])}/{chunks} chunks...')
+        except (FileNotFoundError, KeyError, ValueError):
+            # missing, or truncated by an interrupted write
+            pass
+        done = set(state['done'])
 
-    # Return metadata
-    return {
-        'name': associated,
-        'mpp': mpp,
-        'source': source,
-        'sparse': sparse_map.save(),
-    }
+        hash = sha256()
+        hashed = 0
+        fd = os.open(partial_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, size)
+
+            def hash_chunks() -> None:
+                # hash contiguous completed chunks, rereading them from
+                # the page cache
+                nonlocal hashed
+                while hashed in done:
+                    offset = hashed * chunk_size
+                    end = min(offset + chunk_size, size)
+                    while offset < end:
+                        buf = os.pread(fd, min(end - offset, 1 << 20), offset)
+                        hash.update(buf)
+                        offset += len(buf)
+                    hashed += 1
+
+            with ThreadPoolExecutor(FETCH_WORKERS) as exec:
+                futures = {
+                    exec.submit(
+                        _fetch_range,
+                        session,
+                        url,
+                        fd,
+                        i * chunk_size,
+                        min((i + 1) * chunk_size, size),
+                        ranged,
+                    ): i
+                    for i in range(chunks)
+                    if i not in done
+                }
+                try:
+                    hash_chunks()
+                    for future in as_completed(futures):
+                        future.result()
+                        done.add(futures[future])
+                        state['done'] = sorted(done)
+                        temp_state_path.write_text(json.dumps(state))
+                        os.replace(temp_state_path, state_path)
+                        hash_chunks()
+                except BaseException:
+                    exec.shutdown(cancel_futures=True)
+                    raise
+        finally:
+            os.close(fd)
+
+    if hash.hexdigest() != slide_info['sha256']:
+        partial_path.unlink()
+        state_path.unlink(missing_ok=True)
+        raise OSError(f'Hash mismatch fetching {slide_relpath}')
+    partial_path.rename(path)
+    state_path.unlink(missing_ok=True)
+
+
+def slide_key_basepath(slide_relpath: PurePath) -> PurePath:
+    return PurePath(slide_relpath.with_suffix('').as_posix().lower())
+
+
+def read_slide_metadata(
+    storage: S3Storage, slide_relpath: PurePath
+) -> SlideMetadata | None:
+    """Return a slide's stored slide.json, or None if there isn't one."""
+    try:
+        resp = storage.object(
+            slide_key_basepath(slide_relpath) / SLIDE_METADATA_NAME
+        ).get()
+        with gzip.open(resp['Body']) as body:
+            metadata: SlideMetadata = json.load(body)
+    except storage.NoSuchKey:
+        return None
+    return metadata
+
+
+def count_tiles(info: ImageInfo) -> int:
+    """Return the number of non-sparse tiles in a stored image."""
+    image = info['source']['Image']
+    width, height = image['Size']['Width'], image['Size']['Height']
+    tiles = 0
+    while True:
+        tiles += -(width // -image['TileSize']) * -(
+            height // -image['TileSize']
+        )
+        if width == 1 and height == 1:
+            break
+        width, height = -(width // -2), -(height // -2)
+    for sparse in info['sparse'].values():
+        bitmap = np.frombuffer(base64.b64decode(sparse['bitmap']), np.uint8)
+        count = sparse['tiles'][0] * sparse['tiles'][1]
+        tiles -= int(np.unpackbits(bitmap, bitorder='little')[:count].sum())
+    return tiles
+
+
+def shard_slides(
+    slides: TestDataIndex,
+    names: Sequence[str],
+    images: Mapping[str, Sequence[ImageInfo]],
+    count: int,
+) -> list[list[str]]:
+    """Divide the named slides into at most count shards of about equal
+    estimated retiling time.  A slide's tile count is taken from its
+    stored images if possible, and otherwise estimated from its size,
+    using the bytes per tile of other slides in the same format."""
+
+    # Learn bytes per tile of each format
+    tile_counts: dict[str, int] = {}
+    ratios: dict[str, list[float]] = {}
+    for name, infos in images.items():
+        tile_counts[name] = sum(count_tiles(info) for info in infos)
+        ratios.setdefault(slides[name]['format'], []).append(
+            slides[name]['size'] / max(tile_counts[name], 1)
+        )
+    all_ratios = [
+        r for format_ratios in ratios.values() for r in format_ratios
+    ]
+    default_ratio = (
+        float(np.median(all_ratios)) if all_ratios else SHARD_BYTES_PER_TILE
+    )
+
+    def cost(name: str) -> float:
+        slide_info = slides[name]
+        tiles = tile_counts.get(name)
+        if tiles is None:
+            format_ratios = ratios.get(slide_info['format'])
+            tiles = int(
+                slide_info['size']
+                / (
+                    float(np.median(format_ratios))
+                    if format_ratios
+                    else default_ratio
+                )
+            )
+        return (
+            SHARD_SLIDE_SECONDS
+            + slide_info['size'] / SHARD_FETCH_RATE
+            + tiles / SHARD_TILE_RATE
+        )
+
+    # Assign each slide, most costly first, to the least loaded shard
+    costs = {name: cost(name) for name in names}
+    shards: list[tuple[float, int, list[str]]] = [
+        (0.0, i, []) for i in range(min(count, len(names)))
+    ]
+    for name in sorted(names, key=lambda name: costs[name], reverse=True):
+        total, i, shard = heapq.heappop(shards)
+        shard.append(name)
+        heapq.heappush(shards, (total + costs[name], i, shard))
+    shards.sort(key=lambda shard: shard[1])
+    for total, i, shard in shards:
+        print(f'Shard {i}: {len(shard)} slides, about {total / 60:.0f} min')
+    return [sorted(shard) for _, _, shard in shards]
 
 
 def sync_slide(
@@ -443,81 +2660,112 @@ def sync_slide(
     storage: S3Storage,
     slide_relpath: PurePath,
     slide_info: TestDataSlide,
-    workers: int,
+    formats: Sequence[str],
+    options: TileOptions,
+    timings_path: Path | None = None,
+    pack: bool = False,
+    pool: TilePool | None = None,
+    fetched: Future[Path] | None = None,
+    published_pack: str | None = None,
 ) -> SlideMetadata:
-    """Generate and upload tiles and metadata for a single slide."""
-
-    key_basepath = PurePath(slide_relpath.with_suffix('').as_posix().lower())
+    """Generate and upload tiles in the specified formats, and metadata,
+    for a single slide.  If timings_path is specified and the slide is
+    retiled, write stage timings there.  If pack is true, store each
+    image's tiles in packed objects named for the tiling fingerprint.  If
+    pool is specified, tile with it rather than a new pool, and leave it
+    running.  If fetched is specified, it's a download of the slide
+    already in progress, returning the path.  If published_pack is
+    specified, it's the name of the packed tiles that viewers are still
+    reading; they're kept, and pruned by a later run."""
+
+    key_basepath = slide_key_basepath(slide_relpath)
     metadata_key_name = key_basepath / SLIDE_METADATA_NAME
     properties_key_name = key_basepath / SLIDE_PROPERTIES_NAME
+    manifest_key_name = key_basepath / SLIDE_MANIFEST_NAME
 
     # Get current metadata
-    try:
-        resp = storage.object(metadata_key_name).get()
-        with gzip.open(resp['Body']) as body:
-            metadata: SlideMetadata | None = json.load(body)
-    except storage.NoSuchKey:
-        metadata = None
+    metadata = read_slide_metadata(storage, slide_relpath)
 
     # Return if metadata is current
     if metadata is not None and metadata['stamp'] == stamp:
         return metadata
 
+    # Start enumerating existing keys, which doesn't depend on the slide
+    print(f'Enumerating keys for {slide_relpath}...')
+    timings: dict[str, float] = {}
+    image_times: dict[str, dict[str, dict[str, StageStats]]] = {}
+    lister = ThreadPoolExecutor(1)
+    key_md5sums_future = lister.submit(
+        list_keys,
+        storage,
+        key_basepath,
+        metadata['stamp'] if metadata is not None else None,
+        timings,
+    )
+    lister.shutdown(wait=False)
+
     with TemporaryDirectory(prefix='synctiles-', dir='/var/tmp') as td:
         tempdir = Path(td)
 
         # Fetch slide
-        print(f'Fetching {slide_relpath}...')
-        count = 0
-        hash = sha256()
-        slide_path = tempdir / slide_relpath.name
-        with slide_path.open('wb') as fh:
-            r = requests.get(
-                urljoin(DOWNLOAD_BASE_URL, slide_relpath.as_posix()),
-                stream=True,
-            )
-            r.raise_for_status()
-            for buf in r.iter_content(10 << 20):
-                if not buf:
-                    break
-                fh.write(buf)
-                hash.update(buf)
-                count += len(buf)
-        if count != int(r.headers['Content-Length']):
-            raise OSError(f'Short read fetching {slide_relpath}')
-        if hash.hexdigest() != slide_info['sha256']:
-            raise OSError(f'Hash mismatch fetching {slide_relpath}')
+        if fetched is not None:
+            with timed(timings, 'fetch'):
+                slide_path = fetched.result()
+        else:
+            print(f'Fetching {slide_relpath}...')
+            if options.download_dir is not None:
+                slide_path = options.download_dir / slide_relpath
+                slide_path.parent.mkdir(parents=True, exist_ok=True)
+            else:
+                slide_path = tempdir / slide_relpath.name
+            with timed(timings, 'fetch'):
+                fetch_slide(slide_relpath, slide_info, slide_path)
 
         # Open slide
         slide = None
         try:
-            slide = OpenSlide(slide_path)
+            with timed(timings, 'open'):
+                slide = OpenSlide(slide_path)
         except OpenSlideError:
             if slide_relpath.suffix == '.zip':
                 # Unzip slide
                 print(f'Extracting {slide_relpath}...')
-                temp_path = Path(
-                    TemporaryDirectory(dir=tempdir, delete=False).name
-                )
-                with ZipFile(slide_path) as zf:
-                    zf.extractall(path=temp_path)
-                # Find slide in zip
-                for slide_path in temp_path.iterdir():
-                    try:
-                        slide = OpenSlide(slide_path)
-                    except OpenSlideError:
-                        pass
-                    else:
-                        break
+                with timed(timings, 'extract'):
+                    temp_path = Path(
+                        TemporaryDirectory(dir=tempdir, delete=False).name
+                    )
+                    with ZipFile(slide_path) as zf:
+                        zf.extractall(path=temp_path)
+                    # Find slide in zip
+                    for slide_path in temp_path.iterdir():
+                        try:
+                            slide = OpenSlide(slide_path)
+                        except OpenSlideError:
+                            pass
+                        else:
+                            break
         # slide will be None if we can't read it
 
-        # Enumerate existing keys
-        print(f'Enumerating keys for {slide_relpath}...')
-        key_md5sums = {}
-        for obj in storage.bucket.objects.filter(
-            Prefix=key_basepath.as_posix() + '/'
-        ):
-            key_md5sums[PurePath(obj.key)] = obj.e_tag.strip('"')
+        # Wait for key enumeration
+        with timed(timings, 'list wait'):
+            key_md5sums, prev_fingerprint = key_md5sums_future.result()
+        key_manifest: KeyMd5s = {}
+
+        # If the stored tiles came from the same inputs, we can reuse them
+        # without rendering
+        fingerprint = tiling_fingerprint(slide_info, formats, pack)
+        prev_infos: dict[str | None, ImageInfo] = {}
+        if metadata is not None and prev_fingerprint == fingerprint:
+            print(f'Reusing unchanged tiles for {slide_relpath}...')
+            if 'slide' in metadata:
+                prev_infos[None] = metadata['slide']
+            for info in metadata.get('associated', []):
+                prev_infos[info['name']] = info
+
+        # We're about to modify the slide's keys, so the manifest will be
+        # stale until we write a new one
+        storage.object(manifest_key_name).delete()
+        pruner = KeyPruner(storage)
 
         # Initialize metadata
         metadata = {
@@ -526,9 +2774,6 @@ def sync_slide(
         }
 
         if slide is not None:
-            # Configure cache
-            slide.set_cache(OpenSlideCache(workers << 25))
-
             # Add slide metadata
             metadata.update(
                 {
@@ -551,60 +2796,98 @@ def sync_slide(
                 mpp = None
 
             # Start compute pool
-            exec = ThreadPoolExecutor(workers)
+            own_pool = pool is None
+            if pool is None:
+                pool = TilePool(storage, options, formats)
+            pool.open(slide, slide_path)
             try:
-                # Tile slide
-                def do_tile(
-                    associated: str | None, image: AbstractSlide
-                ) -> ImageInfo:
-                    return sync_image(
-                        exec,
-                        storage,
-                        Generator(image),
-                        slide_relpath,
+                # Tile slide and associated images together
+                images = [
+                    ImageSync(
+                        pool,
                         associated,
                         key_basepath,
                         key_md5sums,
+                        key_manifest,
                         mpp if associated is None else None,
+                        prev_infos.get(associated),
+                        fingerprint if pack else None,
+                        pruner,
                     )
-
-                metadata['slide'] = do_tile(None, slide)
-
-                # Tile associated images
-                for associated, image in sorted(
-                    slide.associated_images.items()
-                ):
-                    cur_props = do_tile(associated, ImageSlide(image))
-                    metadata['associated'].append(cur_props)
+                    for associated in [
+                        None,
+                        *sorted(slide.associated_images),
+                    ]
+                ]
+                with timed(timings, 'tile'):
+                    infos = sync_images(pool, slide_relpath, images)
+                metadata['slide'] = infos[0]
+                metadata['associated'] = infos[1:]
             except BaseException:
-                exec.shutdown(cancel_futures=True)
+                pruner.abort()
+                if own_pool:
+                    pool.shutdown(cancel_futures=True)
                 raise
-            finally:
-                exec.shutdown()
+            else:
+                if own_pool:
+                    pool.shutdown()
+            image_times = {
+                slugify(name) if name else VIEWER_SLIDE_NAME: times.save()
+                for name, times in pool.stage_times.items()
+            }
 
-    # Delete old keys
-    for name in metadata_key_name, properties_key_name:
+    # Delete old keys, except packed tiles that the published bucket
+    # metadata still references
+    for name in metadata_key_name, properties_key_name, manifest_key_name:
         key_md5sums.pop(name, None)
-    if key_md5sums:
-        to_delete = list(key_md5sums)
-        print(f'Pruning {len(to_delete)} keys for {slide_relpath}...')
-        while to_delete:
-            cur_delete, to_delete = to_delete[0:1000], to_delete[1000:]
-            delete_result = storage.bucket.delete_objects(
-                Delete={
-                    'Objects': [{'Key': k.as_posix()} for k in cur_delete],
-                    'Quiet': True,
-                },
-            )
-            if 'Errors' in delete_result:
-                raise OSError(
-                    f'Failed to delete {len(delete_result["Errors"])} keys'
-                )
+    if published_pack is not None:
+        for key_name in [
+            key_name
+            for key_name in key_md5sums
+            if key_name.stem == published_pack
+            and key_name.suffix in ('.pack', '.index')
+        ]:
+            key_manifest[key_name] = key_md5sums.pop(key_name)
+    with timed(timings, 'prune'):
+        pruner.add(key_md5sums)
+        pruner.close()
+    if pruner.count:
+        print(
+            f'Pruned {pruner.count} keys for {slide_relpath} in '
+            f'{pruner.elapsed:.1f} s: '
+            f'{pruner.count / max(pruner.elapsed, 0.001):.0f} keys/s'
+        )
 
     # Update metadata
-    if 'properties' in metadata:
-        storage.upload_metadata(properties_key_name, metadata['properties'])
-    storage.upload_metadata(metadata_key_name, metadata, cache=False)
+    with timed(timings, 'metadata'):
+        manifest: KeyManifest = {
+            'stamp': stamp,
+            'fingerprint': fingerprint,
+            'keys': {
+                key.relative_to(key_basepath).as_posix(): md5sum
+                for key, md5sum in key_manifest.items()
+            },
+        }
+        storage.upload_metadata(manifest_key_name, manifest, cache=False)
+        if 'properties' in metadata:
+            storage.upload_metadata(
+                properties_key_name, metadata['properties']
+            )
+        storage.upload_metadata(metadata_key_name, metadata, cache=False)
+
+    # Report stage timings.  Listing runs concurrently with the fetch.
+    print(
+        f'Stage times for {slide_relpath}: '
+        + ', '.join(f'{name} {secs:.1f} s' for name, secs in timings.items())
+    )
+    if timings_path is not None:
+        slide_timings: SlideTimings = {
+            'stages': timings,
+            'images': image_times,
+        }
+        timings_path.parent.mkdir(parents=True, exist_ok=True)
+        with timings_path.open('w') as fh:
+            json.dump(slide_timings, fh)
 
     return metadata
 
@@ -620,10 +2903,26 @@ def upload_status(
 
 
 def start_retile(
-    bucket_name: str, ctxfile: TextIO, matrixfile: TextIO
+    bucket_name: str,
+    ctxfile: TextIO,
+    matrixfile: TextIO,
+    formats: Sequence[str] = (FORMAT,),
+    pack: bool = False,
+    shards: int | None = None,
+    summarydir: Path | None = None,
 ) -> None:
     """Subcommand to initialize a retiling run.  Writes common state into
-    ctxfile and a list of slides to be retiled into matrixfile."""
+    ctxfile and a list of slides to be retiled into matrixfile.  Tiles will
+    be generated in each of the specified formats, and viewers will use the
+    first one they support.  If pack is true, each image's tiles will be
+    stored in one object per format, which viewers read with HTTP range
+    requests.  If shards is specified, the matrix lists that many shards
+    of slides with about equal estimated cost, for the tile-many
+    subcommand.  If summarydir is specified, slides already tiled with
+    this run's stamp are left out of the matrix, and their summaries are
+    written there.  Slides are known to be current from the bucket
+    metadata of the last finished run, if the bucket is clean, and
+    otherwise from each slide's slide.json."""
 
     # Get openslide-testdata index
     r = requests.get(urljoin(DOWNLOAD_BASE_URL, DOWNLOAD_INDEX))
@@ -642,11 +2941,14 @@ def start_retile(
         'stamp': sha256(
             (
                 f'{openslide.__library_version__} {openslide.__version__} '
-                f'{STAMP_VERSION}'
+                f'{STAMP_VERSION} {TILING_VERSION} {",".join(formats)}'
+                + (' packed' if pack else '')
             ).encode()
         ).hexdigest()[:8],
         'slides': slides,
         'bucket': bucket_name,
+        'formats': list(formats),
+        'pack': pack,
     }
     print(
         f'OpenSlide {context["openslide"]}, '
@@ -654,7 +2956,7 @@ def start_retile(
     )
 
     # Connect to S3
-    storage = S3Storage(bucket_name)
+    storage = S3Storage(bucket_name, METADATA_FETCH_WORKERS)
 
     # Set bucket configuration
     print('Configuring bucket...')
@@ -662,6 +2964,7 @@ def start_retile(
         CORSConfiguration={
             'CORSRules': [
                 {
+                    'AllowedHeaders': ['Range'],
                     'AllowedMethods': ['GET'],
                     'AllowedOrigins': CORS_ORIGINS,
                 },
@@ -677,30 +2980,120 @@ def start_retile(
             ContentType=opts['content-type'],
         )
 
+    # Read the bucket status before changing it
+    try:
+        resp = storage.object(PurePath(STATUS_NAME)).get()
+        with gzip.open(resp['Body']) as body:
+            status: StatusMetadata | None = json.load(body)
+    except storage.NoSuchKey:
+        status = None
+
     # If the stamp is changing, mark bucket dirty
     try:
         resp = storage.object(PurePath(METADATA_NAME)).get()
         with gzip.open(resp['Body']) as body:
-            metadata: BucketMetadata = json.load(body)
-        old_stamp = metadata['stamp']
+            bucket_metadata: BucketMetadata | None = json.load(body)
     except storage.NoSuchKey:
-        old_stamp = None
+        bucket_metadata = None
+    old_stamp = bucket_metadata['stamp'] if bucket_metadata else None
     if context['stamp'] != old_stamp:
         print('Marking bucket dirty...')
         upload_status(storage, dirty=True, stamp=old_stamp)
 
+    # Find the published summary of each slide, and keep the packed tiles
+    # it references until a later run publishes new metadata
+    old_summaries: dict[str, SlideSummary] = {}
+    for group in bucket_metadata['groups'] if bucket_metadata else []:
+        for group_slide in group['slides']:
+            url = group_slide['download_url']
+            if url.startswith(DOWNLOAD_BASE_URL):
+                old_summaries[url.removeprefix(DOWNLOAD_BASE_URL)] = (
+                    group_slide
+                )
+    context['published_packs'] = {
+        name: old_summary['slide']['pack']
+        for name, old_summary in old_summaries.items()
+        if name in slides and 'pack' in old_summary['slide']
+    }
+
+    # Find the stored images of each slide, and the slides already tiled
+    # with this stamp.  If the last finished run had this stamp and no
+    # run has touched the bucket since, the slides in its bucket metadata
+    # are current.  Otherwise, a run with another stamp may have rewritten
+    # any slide, so read slide.json for the rest.
+    pending = sorted(slides)
+    images: dict[str, list[ImageInfo]] = {}
+    if shards is not None or summarydir is not None:
+        published_current = (
+            status is not None
+            and not status['dirty']
+            and status['stamp'] == context['stamp']
+            and old_stamp == context['stamp']
+        )
+
+        current: dict[str, SlideSummary | None] = {}
+        unknown = []
+        for name in pending:
+            old_summary = old_summaries.get(name)
+            if old_summary is not None:
+                images[name] = [
+                    old_summary['slide'],
+                    *old_summary['associated'],
+                ]
+            if old_summary is not None and published_current:
+                current[name] = slide_summary(
+                    PurePath(name), slides[name], old_summary
+                )
+            else:
+                unknown.append(name)
+
+        print(f'Reading metadata of {len(unknown)} slides...')
+        with ThreadPoolExecutor(METADATA_FETCH_WORKERS) as exec:
+            for name, slide_metadata in zip(
+                unknown,
+                exec.map(
+                    lambda name: read_slide_metadata(storage, PurePath(name)),
+                    unknown,
+                ),
+                strict=True,
+            ):
+                if slide_metadata is None:
+                    continue
+                if 'slide' in slide_metadata:
+                    images[name] = [
+                        slide_metadata['slide'],
+                        *slide_metadata['associated'],
+                    ]
+                if slide_metadata['stamp'] == context['stamp']:
+                    current[name] = slide_summary(
+                        PurePath(name), slides[name], slide_metadata
+                    )
+
+        # Summarize slides that are already current
+        if summarydir is not None:
+            for name, summary in current.items():
+                write_summary(summarydir, PurePath(name), summary)
+            pending = [name for name in pending if name not in current]
+            print(f'{len(current)} slides are current')
+
     # Write output files
+    matrix: Matrix
+    if shards is not None:
+        context['shards'] = shard_slides(slides, pending, images, shards)
+        matrix = {'shard': list(range(len(context['shards'])))}
+    else:
+        matrix = {'slide': pending}
     with ctxfile:
         json.dump(context, ctxfile)
     with matrixfile:
-        matrix: Matrix = {
-            'slide': sorted(slides.keys()),
-        }
         json.dump(matrix, matrixfile)
 
 
 def retile_slide(
-    ctxfile: TextIO, slide_relpath: PurePath, summarydir: Path, workers: int
+    ctxfile: TextIO,
+    slide_relpath: PurePath,
+    summarydir: Path,
+    options: TileOptions,
 ) -> None:
     """Subcommand to retile one slide into S3.  Writes summary data into
     summarydir."""
@@ -710,35 +3103,193 @@ def retile_slide(
         context: Context = json.load(ctxfile)
 
     # Connect to S3
-    storage = S3Storage(context['bucket'])
+    storage = S3Storage(context['bucket'], options.upload_workers)
 
     # Tile slide
     slide_info = context['slides'].get(slide_relpath.as_posix())
     if slide_info is None:
         raise SyncError(f'No such slide {slide_relpath}')
     metadata = sync_slide(
-        context['stamp'], storage, slide_relpath, slide_info, workers
-    )
-
-    # Write summary if the slide was readable
-    if 'slide' in metadata:
-        summary: SlideSummary = {
-            'name': metadata['name'],
-            'slide': metadata['slide'],
-            'associated': metadata['associated'],
-            'properties_url': metadata['properties_url'],
-            'credit': slide_info.get('credit'),
-            'description': slide_info['description'],
-            'download_url': urljoin(
-                DOWNLOAD_BASE_URL, slide_relpath.as_posix()
-            ),
-        }
+        context['stamp'],
+        storage,
+        slide_relpath,
+        slide_info,
+        context['formats'],
+        options,
+        summarydir / f'{slide_relpath}{TIMINGS_SUFFIX}',
+        context['pack'],
+        published_pack=context.get('published_packs', {}).get(
+            slide_relpath.as_posix()
+        ),
+    )
+    write_summary(
+        summarydir,
+        slide_relpath,
+        slide_summary(slide_relpath, slide_info, metadata),
+    )
+
+
+def slide_summary(
+    slide_relpath: PurePath,
+    slide_info: TestDataSlide,
+    metadata: SlideMetadata | SlideSummary,
+) -> SlideSummary | None:
+    """Build a slide's summary from its stored metadata, or from its
+    summary in a previous bucket info.json.  Return None if the slide was
+    unreadable."""
+    if 'slide' not in metadata:
+        return None
+    return {
+        'name': metadata['name'],
+        'slide': metadata['slide'],
+        'associated': metadata['associated'],
+        'properties_url': metadata['properties_url'],
+        'credit': slide_info.get('credit'),
+        'description': slide_info['description'],
+        'download_url': urljoin(DOWNLOAD_BASE_URL, slide_relpath.as_posix()),
+    }
+
+
+def write_summary(
+    summarydir: Path, slide_relpath: PurePath, summary: SlideSummary | None
+) -> None:
+    """Write a slide's summary into summarydir if the slide was
+    readable."""
+    if summary is not None:
         summaryfile = summarydir / slide_relpath
         summaryfile.parent.mkdir(parents=True, exist_ok=True)
         with summaryfile.open('w') as fh:
             json.dump(summary, fh)
 
 
+def _prefetch_slide(
+    slide_relpath: PurePath, slide_info: TestDataSlide, path: Path
+) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fetch_slide(slide_relpath, slide_info, path)
+    return path
+
+
+def retile_slides(
+    ctxfile: TextIO,
+    summarydir: Path,
+    options: TileOptions,
+    matrixfile: TextIO | None = None,
+    shard: int | None = None,
+) -> None:
+    """Subcommand to retile many slides in one process: every slide in
+    matrixfile, or the slides in the specified shard of the context.  The
+    tile pool and S3 connections are shared by all slides.  Slides are
+    tiled largest first, so the longest ones aren't left for the end, and
+    each is downloaded while the previous one tiles.  Writes summary data
+    into summarydir."""
+
+    # Load context and slide list
+    with ctxfile:
+        context: Context = json.load(ctxfile)
+    if matrixfile is not None:
+        with matrixfile:
+            matrix: Matrix = json.load(matrixfile)
+        names = matrix.get('slide', [])
+    elif shard is not None:
+        try:
+            names = context.get('shards', [])[shard]
+        except IndexError:
+            raise SyncError(f'No such shard {shard}') from None
+    else:
+        raise SyncError('No slides specified')
+    slides: list[tuple[PurePath, TestDataSlide]] = []
+    for name in names:
+        slide_info = context['slides'].get(name)
+        if slide_info is None:
+            raise SyncError(f'No such slide {name}')
+        slides.append((PurePath(name), slide_info))
+    slides.sort(key=lambda slide: slide[1]['size'], reverse=True)
+
+    # Connect to S3
+    storage = S3Storage(context['bucket'], options.upload_workers)
+
+    failed = []
+    with TemporaryDirectory(prefix='synctiles-', dir='/var/tmp') as td:
+        download_dir = options.download_dir or Path(td)
+        fetcher = ThreadPoolExecutor(1)
+        fetches = [
+            fetcher.submit(
+                _prefetch_slide,
+                slide_relpath,
+                slide_info,
+                download_dir / slide_relpath,
+            )
+            for slide_relpath, slide_info in slides[:1]
+        ]
+        pool = TilePool(storage, options, context['formats'])
+        try:
+            for i, (slide_relpath, slide_info) in enumerate(slides):
+                # Start downloading the next slide
+                if i + 1 < len(slides):
+                    next_relpath, next_info = slides[i + 1]
+                    fetches.append(
+                        fetcher.submit(
+                            _prefetch_slide,
+                            next_relpath,
+                            next_info,
+                            download_dir / next_relpath,
+                        )
+                    )
+
+                # Tile slide
+                print(f'Slide {i + 1}/{len(slides)}: {slide_relpath}')
+                try:
+                    metadata = sync_slide(
+                        context['stamp'],
+                        storage,
+                        slide_relpath,
+                        slide_info,
+                        context['formats'],
+                        options,
+                        summarydir / f'{slide_relpath}{TIMINGS_SUFFIX}',
+                        context['pack'],
+                        pool,
+                        fetches[i],
+                        context.get('published_packs', {}).get(
+                            slide_relpath.as_posix()
+                        ),
+                    )
+                except (
+                    BotoCoreError,
+                    ClientError,
+                    OpenSlideError,
+                    OSError,
+                    SyncError,
+                ):
+                    traceback.print_exc()
+                    failed.append(slide_relpath)
+                    # don't let leftover work from the failed slide reach
+                    # the next one
+                    pool.shutdown(cancel_futures=True)
+                    pool = TilePool(storage, options, context['formats'])
+                    continue
+                finally:
+                    # the slide may have been current without a download
+                    if not fetches[i].cancel():
+                        wait([fetches[i]])
+                    if options.download_dir is None:
+                        (download_dir / slide_relpath).unlink(missing_ok=True)
+                write_summary(
+                    summarydir,
+                    slide_relpath,
+                    slide_summary(slide_relpath, slide_info, metadata),
+                )
+        finally:
+            pool.shutdown()
+            fetcher.shutdown(cancel_futures=True)
+    if failed:
+        raise SyncError(
+            f'Failed to tile {len(failed)} slides: '
+            + ', '.join(p.as_posix() for p in failed)
+        )
+
+
 def finish_retile(ctxfile: TextIO, summarydir: Path) -> None:
     """Subcommand to finish a retiling run.  Reads context file and summary
     dir and writes metadata to S3."""
@@ -787,7 +3338,9 @@ def finish_retile(ctxfile: TextIO, summarydir: Path) -> None:
 
 
 if __name__ == '__main__':
-    thread_count = 2 * os.process_cpu_count()
+    process_count = os.process_cpu_count()
+    thread_count = 2 * process_count
+    upload_count = 32
 
     parser = ArgumentParser()
     subparsers = parser.add_subparsers(metavar='subcommand', required=True)
@@ -807,9 +3360,92 @@ if __name__ == '__main__':
         type=FileType('w'),
         help='path to list of slides to tile (output)',
     )
+    parser_start.add_argument(
+        '-f',
+        '--format',
+        dest='formats',
+        action='append',
+        choices=TILE_FORMATS,
+        help=(
+            f'tile format; repeat to generate several, in order of viewer '
+            f'preference [{FORMAT}]'
+        ),
+    )
+    parser_start.add_argument(
+        '--pack',
+        action='store_true',
+        help='store the tiles of each image in one object per format',
+    )
+    parser_start.add_argument(
+        '--shards',
+        metavar='COUNT',
+        type=int,
+        help='divide slides into COUNT shards of about equal cost',
+    )
+    parser_start.add_argument(
+        '--summary-dir',
+        metavar='DIR',
+        type=Path,
+        help='skip current slides, writing their summaries to DIR',
+    )
     parser_start.set_defaults(cmd='start')
 
-    parser_tile = subparsers.add_parser('tile', help='retile one slide')
+    # options shared by the tile and tile-many subcommands
+    tile_options = ArgumentParser(add_help=False)
+    tile_options.add_argument(
+        '-j',
+        '--jobs',
+        metavar='COUNT',
+        dest='workers',
+        type=int,
+        help=(
+            f'number of workers to start [{thread_count} threads or '
+            f'{process_count} processes]'
+        ),
+    )
+    tile_options.add_argument(
+        '-u',
+        '--upload-jobs',
+        metavar='COUNT',
+        dest='upload_workers',
+        type=int,
+        default=upload_count,
+        help=f'number of concurrent uploads [{upload_count}]',
+    )
+    tile_options.add_argument(
+        '-P',
+        '--processes',
+        action='store_true',
+        help='render tiles in worker processes rather than threads',
+    )
+    tile_options.add_argument(
+        '--async-upload',
+        action='store_true',
+        help='upload tiles with asyncio rather than threads',
+    )
+    tile_options.add_argument(
+        '--download-dir',
+        metavar='DIR',
+        type=Path,
+        help='keep downloaded slides in DIR and resume partial downloads',
+    )
+    tile_options.add_argument(
+        '--in-flight',
+        metavar='COUNT',
+        type=int,
+        help=(
+            'number of tile batches to render concurrently '
+            f'[{COMPUTE_QUEUE_DEPTH} per worker]'
+        ),
+    )
+    tile_options.add_argument(
+        '--color-lut',
+        action='store_true',
+        help='convert colors to sRGB with a precomputed lookup table',
+    )
+    parser_tile = subparsers.add_parser(
+        'tile', parents=[tile_options], help='retile one slide'
+    )
     parser_tile.add_argument(
         'context_file', type=FileType('r'), help='path to context file'
     )
@@ -819,16 +3455,38 @@ if __name__ == '__main__':
     parser_tile.add_argument(
         'summary_dir', type=Path, help='path to summary directory (output)'
     )
-    parser_tile.add_argument(
-        '-j',
-        '--jobs',
-        metavar='COUNT',
-        dest='workers',
+    parser_tile.set_defaults(cmd='tile')
+
+    parser_tile_many = subparsers.add_parser(
+        'tile-many',
+        parents=[tile_options],
+        help='retile the slides in a matrix file in one process',
+    )
+    parser_tile_many.add_argument(
+        'context_file', type=FileType('r'), help='path to context file'
+    )
+    parser_tile_many.add_argument(
+        'summary_dir', type=Path, help='path to summary directory (output)'
+    )
+    tile_many_slides = parser_tile_many.add_mutually_exclusive_group(
+        required=True
+    )
+    tile_many_slides.add_argument(
+        '-m',
+        '--matrix',
+        metavar='FILE',
+        dest='matrix_file',
+        type=FileType('r'),
+        help='tile the slides in a matrix file',
+    )
+    tile_many_slides.add_argument(
+        '-s',
+        '--shard',
+        metavar='INDEX',
         type=int,
-        default=thread_count,
-        help=f'number of threads to start [{thread_count}]',
+        help='tile a shard of slides from the context file',
     )
-    parser_tile.set_defaults(cmd='tile')
+    parser_tile_many.set_defaults(cmd='tile-many')
 
     parser_finish = subparsers.add_parser(
         'finish', help='finish a retiling run'
@@ -843,11 +3501,38 @@ if __name__ == '__main__':
 
     args = parser.parse_args()
     if args.cmd == 'start':
-        start_retile(args.bucket, args.context_file, args.matrix_file)
-    elif args.cmd == 'tile':
-        retile_slide(
-            args.context_file, args.slide, args.summary_dir, args.workers
+        start_retile(
+            args.bucket,
+            args.context_file,
+            args.matrix_file,
+            args.formats or [FORMAT],
+            args.pack,
+            args.shards,
+            args.summary_dir,
+        )
+    elif args.cmd in ('tile', 'tile-many'):
+        options = TileOptions(
+            args.workers
+            or (process_count if args.processes else thread_count),
+            args.upload_workers,
+            args.processes,
+            args.async_upload,
+            args.download_dir,
+            args.in_flight,
+            args.color_lut,
         )
+        if args.cmd == 'tile':
+            retile_slide(
+                args.context_file, args.slide, args.summary_dir, options
+            )
+        else:
+            retile_slides(
+                args.context_file,
+                args.summary_dir,
+                options,
+                args.matrix_file,
+                args.shard,
+            )
     elif args.cmd == 'finish':
         finish_retile(args.context_file, args.summary_dir)
     else: